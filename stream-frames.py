@@ -36,5 +36,8 @@ if __name__ == "__main__":
         sUrl = cfg.streamUrls[sName]
         outputImage = os.path.join(args.outputDir, "{}_{}.jpg".format(sName, time.strftime(args.dateTimeFormat)))
         print "Putting frame from stream '{}' into file '{}' ...".format(sName, outputImage)
-        dvrutils.grabframe(sUrl, outputImage)
+        # use the snapshot the recorder keeps (if any) rather than opening another connection to the camera
+        snapshots = [os.path.join(p, sName, dvrutils.SNAPSHOT_NAME) for p in cfg.storagePaths]
+        snapshots = [f for f in snapshots if os.path.exists(f)]
+        dvrutils.grabframe(sUrl, outputImage, snapshotFile=snapshots[0] if len(snapshots) > 0 else None)
     
\ No newline at end of file
@@ -51,10 +51,7 @@ if __name__ == "__main__":
         # TODO run videoarchiver.py here somewhere
         
         # keep watching the threads, restarting them if they end (scheduling, etc. handled by streamManager)
-        while True:
-            streamManager.check_stream_threads()                     # checks all threads, restarting them if they stop
-            infoSender.check_sender()
-            time.sleep(1) # sleeps an additional 5 seconds in check_stream_threads
+        streamManager.supervise(infoSender)                         # only wakes up when a stream or the sender needs attention
         
     except:
         # don't log anything if argparse had us exit
@@ -0,0 +1,113 @@
+'''
+Runs the recorders as coroutines on a single event loop thread.
+
+The recorders describe a recording as a generator of steps (see
+ProcessManager.record_steps). By default each stream runs its generator in
+its own thread, blocking on every step. The AsyncEngine runs all of them on
+one asyncio loop instead, so idle streams cost a coroutine rather than an OS
+thread and its stack. Blocking calls (killing processes, syncing, camera
+restarts) still go to a small thread pool.
+'''
+
+import asyncio
+import os
+import signal
+import sys
+import threading
+
+
+class AsyncProcess(object):
+    """Gives an asyncio subprocess the parts of the Popen interface the recorders use."""
+    def __init__(self, process):
+        self.process = process
+        self.pid = process.pid
+        self.stdout = None              # read by the engine, not by the shared output monitor
+
+    def poll(self):
+        return self.process.returncode
+
+    def send_signal(self, sig):
+        # signal the pid directly so other threads don't have to go through the loop
+        if self.process.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class AsyncEngine(object):
+    """Runs the recording generators of many streams on one event loop."""
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            if sys.version_info < (3, 12) and hasattr(os, 'pidfd_open'):
+                # older versions default to a watcher thread per child, which is what this engine avoids
+                watcher = asyncio.PidfdChildWatcher()
+                asyncio.set_child_watcher(watcher)
+                watcher.attach_loop(self.loop)
+            self.thread = threading.Thread(target=self.loop.run_forever)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def start_recording(self, recorder):
+        """Start recorder.record_steps() on the loop. Safe to call from any thread."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.run_recording(recorder), self.loop)
+
+    async def run_recording(self, recorder):
+        try:
+            return await self.run_steps(recorder, recorder.record_steps())
+        finally:
+            recorder.recording_ended()
+
+    async def run_steps(self, recorder, steps):
+        result = None
+        while True:
+            try:
+                step = steps.send(result)
+            except StopIteration as e:
+                return e.value
+            result = await self.do_step(recorder, step)
+
+    async def do_step(self, recorder, step):
+        kind = step[0]
+        if kind == 'sleep':
+            await asyncio.sleep(step[1])
+        elif kind == 'wait':
+            try:
+                await asyncio.wait_for(recorder.process.process.wait(), step[1] if len(step) > 1 else recorder.checkInterval)
+            except asyncio.TimeoutError:
+                pass
+        elif kind == 'spawn':
+            process = await asyncio.create_subprocess_exec(*step[1], stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+            output = step[2] if len(step) > 2 else recorder.processOutput
+            self.loop.create_task(output.read_stream(process.stdout))
+            return AsyncProcess(process)
+        elif kind == 'ready':
+            deadline = self.loop.time() + step[1]
+            while not recorder.is_ready():
+                remaining = deadline - self.loop.time()
+                if recorder.process.poll() is not None or remaining <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for(recorder.process.process.wait(), min(remaining, recorder.readyCheckInterval))
+                except asyncio.TimeoutError:
+                    pass
+            return True
+        elif kind == 'call':
+            return await self.loop.run_in_executor(None, step[1], *step[2:])
+        else:
+            raise ValueError('Unknown recording step {}'.format(kind))
@@ -14,6 +14,19 @@ from streamrecorder import sender
 from streamrecorder import stream
 from streamrecorder import tracker
 
+# optional stream settings (streams.cfg defaults or stream options), mapped to the recorder argument they set
+RECORDER_OPTIONS = {'segmentfiles': ('segmentFiles', dvrutils.str_to_bool),
+                    'overlapseconds': ('overlapSeconds', int),
+                    'proxycontainer': ('proxyContainer', lambda v: None if v.strip().lower() in ['', 'none'] else v.strip()),
+                    'proxycodec': ('proxyCodec', str),
+                    'proxywidth': ('proxyWidth', int),
+                    'proxyframerate': ('proxyFrameRate', int),
+                    'snapshotseconds': ('snapshotSeconds', int),
+                    'priority': ('priority', int)}
+# optional settings from streamrecorder.cfg that are passed on to the StreamManager
+MANAGER_OPTIONS = {'engine': ('engine', lambda v: v.strip().lower()),
+                   'packcameras': ('packCameras', int),
+                   'cpubudget': ('cpuBudget', float)}
 
 class CameraInfo(object):
     """A class for managing camera URLs and credentials."""
@@ -93,12 +106,13 @@ class ConfigurationHandler(object):
             streamManager = stream.StreamManager(self.deviceName, self.execPath, self.path, self.logger, self.logFilePath, 
                                               logLevel=self.logLevel, logLocation=self.logLocation,  
                                               overwriteFiles=self.overwriteFiles, minDaysOld=self.minDaysOld,
-                                              initTime=15, performRestarts=True, onvifDir=self.genParams['onvifdir'], port=self.genParams['port'])
+                                              initTime=15, performRestarts=True, onvifDir=self.genParams['onvifdir'], port=self.genParams['port'],
+                                              **self.get_manager_options())
         else:    
             streamManager = stream.StreamManager(self.deviceName, self.execPath, self.path, self.logger, self.logFilePath, 
                                                   logLevel=self.logLevel, logLocation=self.logLocation,  
                                                   overwriteFiles=self.overwriteFiles, minDaysOld=self.minDaysOld,
-                                                  initTime=15, performRestarts=False)
+                                                  initTime=15, performRestarts=False, **self.get_manager_options())
         if not self.streamParams:
             self.create_params_dict()
         for streamName, args in self.streamParams.items():
@@ -111,12 +125,33 @@ class ConfigurationHandler(object):
                     self.streamParams[streamName]['schedule'].print_recording_schedule(self.logger)
                     streamManager.add_video_stream(streamName, args['url'], args['container'], args['codec'], args['quality'],
                                                     args['framerate'], args['schedule'], self.ffmpegLogLevel, args['user'],
-                                                    args['passwd'], args['manu'], args['ip'])
+                                                    args['passwd'], args['manu'], args['ip'], **self.get_recorder_options(args))
                 else:
                     streamManager.add_video_stream(streamName, args['url'], args['container'], args['codec'], args['quality'],
-                                                    args['framerate'], args['schedule'], self.ffmpegLogLevel, None)
+                                                    args['framerate'], args['schedule'], self.ffmpegLogLevel, None,
+                                                    **self.get_recorder_options(args))
         return streamManager
 
+    def get_recorder_options(self, args):
+        options = {}
+        for o, (argName, convert) in RECORDER_OPTIONS.items():
+            if o in args:
+                try:
+                    options[argName] = convert(args[o])
+                except:
+                    raise Exception('Invalid value {} for stream option {}'.format(args[o], o))
+        return options
+
+    def get_manager_options(self):
+        options = {}
+        for o, (argName, convert) in MANAGER_OPTIONS.items():
+            if o in self.genParams:
+                try:
+                    options[argName] = convert(self.genParams[o])
+                except:
+                    raise Exception('Invalid value {} for option {}'.format(self.genParams[o], o))
+        return options
+
     def get_sender_info(self):
         senderDict = {}
         senderDict['user'] = self.genParams['sender']['user']
@@ -291,6 +326,9 @@ class ConfigurationHandler(object):
         for o in optionsList:
             if o not in args:
                 args[o] = self.streamParams['default'][o]
+        for o in RECORDER_OPTIONS:
+            if o not in args and o in self.streamParams['default']:
+                args[o] = self.streamParams['default'][o]
         if schedStr == '':
             args['schedule'] = deepcopy(self.streamParams['default']['schedule'])
         else:
@@ -1,4 +1,5 @@
 import os
+import shutil
 import sys
 import math
 import time
@@ -6,11 +7,24 @@ import traceback
 import logging, logging.handlers
 import subprocess
 
-def grabframe(streamUrl, outputImage, loglevel='quiet'):
+from streamrecorder import terminator
+
+# name of the image a camera stream keeps updating in its storage directory (see SnapshotSeconds in streams.cfg)
+SNAPSHOT_NAME = 'snapshot.jpg'
+
+def grabframe(streamUrl, outputImage, loglevel='quiet', snapshotFile=None, maxAge=60):
     """
     Download a single frame from the stream at streamUrl into the file 
-    outputImage. Returns the return code of the ffmpeg commmand.
+    outputImage. If snapshotFile was updated by the recorder in the last 
+    maxAge seconds, it is copied instead so the camera doesn't need another 
+    connection. Returns the return code of the ffmpeg commmand.
     """
+    if snapshotFile is not None and os.path.exists(snapshotFile) and time.time() - os.path.getmtime(snapshotFile) < maxAge:
+        try:
+            shutil.copyfile(snapshotFile, outputImage)
+            return 0
+        except (IOError, OSError):
+            pass                # grab a frame from the camera instead
     return subprocess.call(['ffmpeg','-loglevel',loglevel,'-y','-rtsp_transport','tcp','-i',streamUrl,'-vframes','1','-q','1',outputImage])
 
 def yesno(prompt,default='n'):
@@ -203,6 +217,16 @@ def get_disk_usage(path, mounted=True):
             bytesFree = (s.f_bavail * s.f_frsize)
     return bytesFree                                                        # otherwise return -1 to reflect an error
 
+def get_process_cpu_time(pid):
+    """Get the CPU time (user + system seconds) used so far by process pid, or None if it can't be read."""
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            fields = f.read().rsplit(')', 1)[1].split()       # the name in brackets may contain spaces
+    except (IOError, OSError, IndexError):
+        return None
+    # utime and stime are fields 14 and 15 of the stat line
+    return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+
 def get_unique_filename(fname, nZeros=5):
     # Returns a unique filename made from fname (appends suffix 00000-99999 if file exists to avoid overwriting)
     newname = fname
@@ -215,25 +239,22 @@ def get_unique_filename(fname, nZeros=5):
             i += 1
     return newname
     
-def kill_process(process, logger):
-    pstat = process.poll()
-    if pstat is None:
-        try:
-            process.terminate()
-            time.sleep(3)
-        except:
-            logger.error('Process did not respond to SIGINT')
-    elif pstat is not None:
+def kill_process(process, logger, wait=True):
+    """Stop process with SIGTERM, then SIGKILL if it is still running after a few
+    seconds. Returns as soon as the process exits, or right away if wait is False
+    (the process is then stopped in the background).
+    """
+    kill_processes([process], logger, wait)
+
+def kill_processes(processes, logger, wait=True):
+    """Stop many processes at once (see kill_process)."""
+    stopper = terminator.get_terminator()
+    running = [p for p in processes if p.poll() is None]
+    if len(running) < len(processes):
         logger.error("Process killed successfully!")
-    pstat = process.poll()
-    if pstat is None:
-        logger.error("Process is still alive! Trying SIGKILL!")
-        try:
-            process.kill()
-            time.sleep(3)
-        except:
-            logger.error("Process did not respond to SIGKILL!")
-    pstat = process.poll()
-    if pstat is None:
-        logger.critical("Could not kill process! Somthing weird is happening!")
+    for process in running:
+        stopper.stop(process, logger)
+    if wait:
+        stopper.wait(running)
+
         
\ No newline at end of file
@@ -0,0 +1,270 @@
+'''
+Non-blocking capture of the output of child processes.
+
+A single background thread watches the output pipes of all child processes
+with a selector, so a chatty process can never stall the recorder threads.
+Each stream keeps its most recent output lines in a fixed-size ring and
+writes its output to the process log in batches. Lines from ffmpeg's
+-progress output are parsed into live ingest metrics instead of being
+logged.
+'''
+
+import collections
+import math
+import os
+import re
+import selectors
+import threading
+import time
+
+
+class ProcessOutput(object):
+    """The captured output of the processes started by one stream."""
+    def __init__(self, logName, maxLines=200, batchLines=100, flushInterval=5, maxLineLength=4096):
+        self.logName = logName
+        self.recentLines = collections.deque(maxlen=maxLines)
+        self.batchLines = batchLines
+        self.flushInterval = flushInterval
+        self.maxLineLength = maxLineLength
+        self.pending = []
+        self.partial = ''
+        self.lineCount = 0
+        self.lastFlush = time.monotonic()
+        self.lock = threading.Lock()
+        self.progress = None
+
+    def watch(self, process, monitor=None):
+        """Start capturing the output of process in the background."""
+        if process.stdout is None:
+            return
+        monitor = get_monitor() if monitor is None else monitor
+        monitor.add(process.stdout.fileno(), self)
+
+    def feed(self, data):
+        """Add raw output from the process, splitting it into lines."""
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'replace')
+        # ffmpeg ends its status lines with carriage returns, treat them as line ends too
+        pieces = re.split(r'[\r\n]', self.partial + data)
+        self.partial = pieces.pop()
+        if len(self.partial) > self.maxLineLength:
+            pieces.append(self.partial)
+            self.partial = ''
+        for line in pieces:
+            self.add_line(line)
+
+    def add_line(self, line):
+        if line.strip() == '':
+            return
+        if self.progress is not None and self.progress.parse_line(line):
+            return
+        eptime = time.time()
+        ms = int(1000*(eptime-math.floor(eptime)))
+        line = time.strftime("%H:%M:%S,{:0>3d} -- ".format(ms), time.localtime(eptime)) + line[:self.maxLineLength] + '\n'
+        with self.lock:
+            self.recentLines.append(line)
+            self.pending.append(line)
+            self.lineCount += 1
+
+    async def read_stream(self, reader, readSize=65536):
+        """Capture the output from an asyncio stream until it closes (used by the AsyncEngine)."""
+        while True:
+            data = await reader.read(readSize)
+            if not data:
+                break
+            self.feed(data)
+            if self.needs_flush():
+                self.flush()
+        self.close()
+
+    def needs_flush(self, now=None):
+        now = time.monotonic() if now is None else now
+        return len(self.pending) >= self.batchLines or (len(self.pending) > 0 and now - self.lastFlush >= self.flushInterval)
+
+    def flush(self):
+        """Write all pending lines to the process log in one go. Returns the number of lines written."""
+        with self.lock:
+            if len(self.pending) == 0:
+                return 0
+            lines, self.pending = self.pending, []
+            self.lastFlush = time.monotonic()
+        try:
+            with open(self.logName, 'a') as logFile:
+                logFile.writelines(lines)
+        except (IOError, OSError):
+            return 0                # the lines are dropped (but still in the ring) so a broken log can't grow memory
+        return len(lines)
+
+    def close(self):
+        """Called once the process closes its output."""
+        if self.partial != '':
+            self.add_line(self.partial)
+            self.partial = ''
+        self.flush()
+
+    def get_recent_lines(self, n=None):
+        with self.lock:
+            lines = list(self.recentLines)
+        return lines if n is None else lines[-n:]
+
+
+# keys ffmpeg writes in each block of -progress output
+PROGRESS_KEYS = ['frame', 'fps', 'bitrate', 'total_size', 'out_time_us', 'out_time_ms', 'out_time',
+                 'dup_frames', 'drop_frames', 'speed', 'progress']
+
+class ProgressTracker(object):
+    """Live ingest metrics of one stream, parsed from ffmpeg's -progress output."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.onUpdate = None                # called after every block of progress
+        self.reset()
+
+    def reset(self):
+        """Forget everything about the last process (call before starting a new one)."""
+        with self.lock:
+            self.block = {}
+            self.metrics = {}
+            self.updateCount = 0
+            self.lastUpdate = None
+            self.lastAdvance = None
+            self.ended = False
+
+    def parse_line(self, line):
+        """Parse a line of output, returning True if it was a progress line."""
+        key, sep, value = line.strip().partition('=')
+        value = value.strip()
+        if sep == '' or ' ' in value or not (key in PROGRESS_KEYS or key.startswith('stream_')):
+            return False
+        if key == 'progress':
+            self.publish(value)
+        else:
+            self.block[key] = value
+        return True
+
+    def publish(self, state):
+        metrics = {'frame': read_number(self.block.get('frame'), int),
+                   'fps': read_number(self.block.get('fps')),
+                   'bitrate': read_number(self.block.get('bitrate', '').replace('kbits/s', '')),       # kbit/s
+                   'totalSize': read_number(self.block.get('total_size'), int),
+                   'outTime': read_number(self.block.get('out_time_us'), int),                          # microseconds
+                   'speed': read_number(self.block.get('speed', '').rstrip('x')),
+                   'dupFrames': read_number(self.block.get('dup_frames'), int),
+                   'dropFrames': read_number(self.block.get('drop_frames'), int)}
+        if metrics['outTime'] is not None:
+            metrics['outTime'] = metrics['outTime'] / 1000000.0
+        now = time.monotonic()
+        with self.lock:
+            lastOutTime = self.metrics.get('outTime')
+            if self.lastAdvance is None or (metrics['outTime'] is not None and (lastOutTime is None or metrics['outTime'] > lastOutTime)):
+                self.lastAdvance = now
+            self.metrics = metrics
+            self.block = {}
+            self.updateCount += 1
+            self.lastUpdate = now
+            self.ended = (state == 'end')
+        if self.onUpdate is not None:
+            self.onUpdate()
+
+    def get_stall_time(self, now=None):
+        """Seconds since the media time last advanced, or None if there is no progress yet."""
+        if self.lastAdvance is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return now - self.lastAdvance
+
+    def get_metrics(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        metrics['updates'] = self.updateCount
+        metrics['stalledFor'] = self.get_stall_time()
+        return metrics
+
+def read_number(value, convert=float):
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        return None             # ffmpeg reports N/A until it knows
+
+
+class OutputMonitor(object):
+    """Reads the output pipes of all child processes from one thread."""
+    def __init__(self, checkInterval=1, readSize=65536):
+        self.checkInterval = checkInterval
+        self.readSize = readSize
+        self.selector = selectors.DefaultSelector()
+        self.outputs = {}
+        self.newPipes = collections.deque()
+        self.wakeRead, self.wakeWrite = os.pipe()
+        os.set_blocking(self.wakeRead, False)
+        os.set_blocking(self.wakeWrite, False)
+        self.selector.register(self.wakeRead, selectors.EVENT_READ, None)
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, fd, output):
+        # use our own copy of the pipe so it stays valid even if the Popen object goes away
+        fd = os.dup(fd)
+        os.set_blocking(fd, False)
+        self.newPipes.append((fd, output))
+        try:
+            os.write(self.wakeWrite, b'\0')
+        except BlockingIOError:
+            pass            # a wake up is already pending
+
+    def register_new_pipes(self):
+        try:
+            while os.read(self.wakeRead, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        while len(self.newPipes) > 0:
+            fd, output = self.newPipes.popleft()
+            self.outputs[fd] = output
+            self.selector.register(fd, selectors.EVENT_READ, output)
+
+    def read_pipe(self, fd, output):
+        try:
+            data = os.read(fd, self.readSize)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if data:
+            output.feed(data)
+            if len(output.pending) >= output.batchLines:
+                output.flush()
+        else:
+            # end of file, the process is done with this pipe
+            self.selector.unregister(fd)
+            os.close(fd)
+            self.outputs.pop(fd, None)
+            output.close()
+
+    def run(self):
+        while True:
+            for key, mask in self.selector.select(timeout=self.checkInterval):
+                if key.data is None:
+                    self.register_new_pipes()
+                else:
+                    self.read_pipe(key.fd, key.data)
+            now = time.monotonic()
+            for output in set(self.outputs.values()):
+                if output.needs_flush(now):
+                    output.flush()
+
+
+_monitor = None
+_monitorLock = threading.Lock()
+
+def get_monitor():
+    """Get the shared output monitor, starting it the first time it is needed."""
+    global _monitor
+    with _monitorLock:
+        if _monitor is None:
+            _monitor = OutputMonitor()
+            _monitor.start()
+    return _monitor
@@ -245,7 +245,37 @@ class RecordingSchedule:
             recordSecs = min(recordSecs, nextEnd)            
             
         return recordSecs
-    
+
+    def get_active_duration(self, atTime=None):
+        # retrieves the time left in the current recording interval (for recorders that cut files themselves)
+        activeSecs = 0
+        if self.check_recording_schedule(atTime) is True:
+            atTime = time.time() if atTime is None else atTime
+            currTime = time.localtime(atTime)
+            currSec = currTime.tm_hour*3600 + currTime.tm_min*60 + currTime.tm_sec
+            activeSecs = max(self.get_interval_endtime(atTime) - currSec, 0)
+        return activeSecs
+
+    def get_next_transition(self, atTime=None):
+        # gets the time when the schedule next starts or stops recording (None if it never will)
+        if not self.haveSchedule:
+            return None
+        atTime = time.time() if atTime is None else atTime
+        currTime = time.localtime(atTime)
+        currSec = currTime.tm_hour*3600 + currTime.tm_min*60 + currTime.tm_sec
+        midnight = atTime - currSec
+        if self.check_recording_schedule(atTime) is True:
+            return midnight + max(self.get_interval_endtime(atTime), currSec + 60)
+        for dayOffset in range(0, 8):
+            dayTime = time.localtime(midnight + dayOffset*86400 + 43200)
+            day = self.recordingDays.get(DAYS_OF_WEEK[(dayTime.tm_wday + 1) % 7])
+            if day is None:
+                continue
+            starts = [start for start, end in day.recordingIntervals if start < end and (dayOffset > 0 or start > currSec)]
+            if len(starts) > 0:
+                return midnight + dayOffset*86400 + min(starts)
+        return None
+
     def get_start_minute(self, currMin):
         # round up to the next interval start
         if (currMin % self.fileDurationMinutes) == 0:
@@ -27,6 +27,10 @@ class InformationSender(object):
             self.reportFail = False
             self.logger.warning('Failed to send stream information')
     
+    def get_next_send(self):
+        """Get the time the next report is due."""
+        return self.lastSend + self.sendIntervalSeconds
+
     def send_info(self): # TODO: what is virtual_host? Should it be read in as an argument?
         try:
             # open a connection to the message queue server
@@ -1,6 +1,7 @@
 import os
 import glob
 import datetime
+import functools
 import time
 import math
 import operator
@@ -17,12 +18,16 @@ sys.path.append('..')
 
 from streamrecorder import schedule
 from streamrecorder import dvrutils
+from streamrecorder import asyncengine
+from streamrecorder import processoutput
+from streamrecorder import supervisor
 
 
 class StreamManager(object):
     """A class for managing the recording of multiple streams from multiple IP streams simultaneously."""
     def __init__(self, dvrName, execPath, storagePath, mainLogger, logFilePath, logLevel='INFO', logLocation='../logs/',
-                 overwriteFiles=False, minDaysOld=3, initTime=15, performRestarts=False, onvifDir=None, port=None):
+                 overwriteFiles=False, minDaysOld=3, initTime=15, performRestarts=False, onvifDir=None, port=None,
+                 engine='threads', packCameras=0, cpuBudget=None):
         self.dvrName = dvrName
         self.execPath = execPath
         self.appDir = os.path.dirname(execPath)
@@ -36,10 +41,22 @@ class StreamManager(object):
         self.overwriteFiles = overwriteFiles
         self.minDaysOld = minDaysOld
         self.processes = {}
+        self.groups = []
+        self.packCameras = packCameras              # record up to this many cameras with each ffmpeg process (0 or 1 for one process per camera)
+        self.cpuBudget = cpuBudget                  # share of all the cores the recordings may use (None for no limit)
+        self.cpuCheckInterval = 30
         self.streamStarts = {}
         self.corruptedUSBs = []
         self.mainLogger = mainLogger
         self.storageFull = False
+        self.storageCheckInterval = 30
+        self.supervisor = supervisor.Supervisor()
+        if engine == 'asyncio':
+            self.engine = asyncengine.AsyncEngine()
+        elif engine == 'threads':
+            self.engine = None
+        else:
+            raise Exception('Unknown recording engine {}'.format(engine))
         self.onvifDir = onvifDir
         if onvifDir is not None:
             sys.path.append(onvifDir)
@@ -48,14 +65,20 @@ class StreamManager(object):
     # Stream Managing Functions
     #------------------------------------------------------------
     def add_video_stream(self, streamName, streamURL, videoContainer, videoCodec, videoQuality, outputFrameRate,
-                         recordingSchedule, ffmpegLogLevel='warning', usr=None, password=None, manu=None, ip=None):
+                         recordingSchedule, ffmpegLogLevel='warning', usr=None, password=None, manu=None, ip=None,
+                         segmentFiles=False, overlapSeconds=0, proxyContainer=None, proxyCodec='libx264', proxyWidth=320,
+                         proxyFrameRate=5, snapshotSeconds=0, priority=0):
         videoLocation = os.path.join(self.storagePath, streamName)
         if not os.path.exists(videoLocation):
             self.mainLogger.info("Folder {} does not exist. Creating it now!".format(videoLocation))
             os.makedirs(videoLocation)
         cr = CameraRecorder(self.dvrName, streamName, streamURL, videoContainer, videoCodec, videoQuality, outputFrameRate, recordingSchedule,
                             videoLocation, ffmpegLogLevel=ffmpegLogLevel, logLocation=self.logLocation, logLevel=self.logLevel, initTime=self.initTime,
-                            performRestarts=self.performRestarts, user=usr, passwd=password, manufacturer=manu, ipAddr=ip, port=self.port, onvifDir=self.onvifDir)
+                            performRestarts=self.performRestarts, user=usr, passwd=password, manufacturer=manu, ipAddr=ip, port=self.port, onvifDir=self.onvifDir,
+                            segmentFiles=segmentFiles, overlapSeconds=overlapSeconds, proxyContainer=proxyContainer, proxyCodec=proxyCodec,
+                            proxyWidth=proxyWidth, proxyFrameRate=proxyFrameRate, snapshotSeconds=snapshotSeconds, priority=priority)
+        cr.supervisor = self.supervisor
+        cr.engine = self.engine
         self.processes.update({streamName: cr})
 
     def add_command_stream(self, streamName, container, commandStr, recordingSchedule):
@@ -64,17 +87,87 @@ class StreamManager(object):
             self.mainLogger.info("Folder {} does not exist. Creating it now!".format(path))
             os.makedirs(path)
         cr = CommandRecorder(self.dvrName, streamName, path, container, commandStr, recordingSchedule, self.logLocation, self.logLevel)
+        cr.supervisor = self.supervisor
+        cr.engine = self.engine
         self.processes.update({streamName : cr})
 
     def start_streams(self):
+        if self.packCameras > 1 and len(self.groups) == 0:
+            self.pack_camera_streams()
+        self.plan_cpu()
         self.mainLogger.info("Starting {} streams".format(len(self.processes)))
         for name, stream in self.processes.items():
             stream.start_recording()
 
+    def pack_camera_streams(self):
+        """Put the cameras that only copy their stream into groups of up to
+        packCameras that are recorded by a single ffmpeg process. Cameras are
+        only packed with others on the same schedule, so their files line up.
+        """
+        candidates = {}
+        for name in sorted(self.processes):
+            stream = self.processes[name]
+            if isinstance(stream, CameraRecorder) and stream.can_be_packed():
+                key = (stream.recordingSchedule.schedStr, stream.recordingSchedule.fileDurationMinutes, stream.endAtDuration)
+                candidates.setdefault(key, []).append(stream)
+        for members in candidates.values():
+            for i in range(0, len(members), self.packCameras):
+                if len(members[i:i+self.packCameras]) < 2:
+                    continue
+                group = CameraGroup(members[i:i+self.packCameras], logLocation=self.logLocation, logLevel=self.logLevel, initTime=self.initTime)
+                group.supervisor = self.supervisor
+                group.engine = self.engine
+                self.groups.append(group)
+                self.mainLogger.info("Recording streams {} with one process".format(', '.join(m.streamName for m in group.members)))
+
+    def measure_cpu(self):
+        """Measure the CPU used by every recording process. Returns the cores
+        used by the processes that only copy their streams.
+        """
+        copyCost = 0
+        for stream in list(self.processes.values()) + self.groups:
+            if stream.group is not None:
+                continue                # measured through its group
+            cost = stream.measure_cpu()
+            if cost is not None and not stream.is_transcoding():
+                copyCost += cost
+        return copyCost
+
+    def plan_cpu(self):
+        """Keep the transcoding streams within cpuBudget. The streams are
+        given CPU in order of priority, each at the best level that still
+        leaves room for the streams after it to at least copy their video.
+        Streams that don't fit are degraded (to a lower frame rate, then to
+        copying) before the host runs out of CPU.
+        """
+        if self.cpuBudget is None:
+            return
+        available = self.cpuBudget * (os.cpu_count() or 1) - self.measure_cpu()
+        streams = sorted([s for s in self.processes.values() if s.is_transcoding() and s.isActive],
+                         key=lambda s: (-s.priority, s.streamName))
+        reserved = sum(s.estimate_cpu_cost(CPU_COPY) for s in streams)
+        for stream in streams:
+            reserved -= stream.estimate_cpu_cost(CPU_COPY)
+            level = CPU_COPY
+            for l in range(CPU_COPY + 1):
+                if stream.estimate_cpu_cost(l) <= available - reserved:
+                    level = l
+                    break
+            available -= stream.estimate_cpu_cost(level)
+            if level != stream.cpuLevel:
+                self.mainLogger.info("Stream {} (priority {}) will record at CPU level {}".format(stream.streamName, stream.priority, level))
+                stream.set_cpu_level(level)
+
     def restart_logger(self):
         self.mainLogger = dvrutils.setup_logging(self.logFilePath, self.logLevel, self.dvrName,
                                                  logToFile=True, logToStdout=True, logToEmail=False, toaddrs=None)
 
+    def get_stream_metrics(self):
+        """Get the live ingest metrics (frames, fps, bitrate, media time, speed,
+        dropped/duplicated frames) of every stream, keyed by stream name.
+        """
+        return {name: stream.get_ingest_metrics() for name, stream in self.processes.items()}
+
     def check_available_storage(self, spaceNeeded=None): # returns true if storage full, false if not
         # get the available space
         self.mainLogger.debug("Checking storage space...")
@@ -168,8 +261,8 @@ class StreamManager(object):
                 stream.start_recording(location)
                 self.streamStarts[name] = time.time()
             else:
-                # wait initTime before checking file growth
-                if name in self.streamStarts:
+                # wait until the stream is ready (or initTime at most) before checking file growth
+                if name in self.streamStarts and stream.isStarting:
                     if (time.time() - self.streamStarts[name]) < self.initTime:
                         self.mainLogger.info("Waiting to check stream {} ...".format(name))
                         return
@@ -202,7 +295,7 @@ class StreamManager(object):
                 for name, stream in self.processes.items():
                     stream.consecutiveFailCount = 0
 
-    def check_stream_threads(self, usbMountDirForm='/media/usb', maxFileDeletions=10, changeDirAtFailCount=3):
+    def check_storage(self, usbMountDirForm='/media/usb', maxFileDeletions=10):
         # check available storage space
         storageFull = self.check_available_storage()
         self.mainLogger.debug("Storage is {} with {} free and {} needed".format("full" if storageFull else "not full", self.strBytesFree, self.strSpaceNeeded))
@@ -215,18 +308,93 @@ class StreamManager(object):
             self.storageFull = False
             self.mainLogger.critical("Storage is available again! Starting recording threads...")
 
+    def check_stream_threads(self, usbMountDirForm='/media/usb', maxFileDeletions=10, changeDirAtFailCount=3):
+        self.check_storage(usbMountDirForm, maxFileDeletions)
         if not self.storageFull:        # don't bother checking anything if storage is full, since we know the threads will (eventually) fail continuously
             # watch threads to restart when they return (if we are in the active period and there is available storage space)
             for name, stream in self.processes.items():
                 self.mainLogger.debug("Checking stream {}".format(name))
                 self.check_stream(name, stream)
             self.check_fail_count(usbMountDirForm, changeDirAtFailCount)
+            self.plan_cpu()
         time.sleep(5)
 
+    def supervise(self, infoSender=None, usbMountDirForm='/media/usb', maxFileDeletions=10, changeDirAtFailCount=3, maxRounds=None):
+        """Watch the streams like check_stream_threads, but only wake up when
+        something can change: a schedule transition, a growth check or report
+        coming due, or a recording process exiting. Runs forever by default.
+        """
+        self.supervisorArgs = (usbMountDirForm, maxFileDeletions, changeDirAtFailCount)
+        now = time.time()
+        self.supervisor.schedule('storage', now, self.storage_event)
+        for name in self.processes:
+            self.supervisor.schedule(name, now, lambda name=name: self.stream_event(name))
+        if infoSender is not None:
+            self.supervisor.schedule('sender', now, lambda: self.sender_event(infoSender))
+        if self.cpuBudget is not None:
+            self.supervisor.schedule('cpu', get_next_tick(now, self.cpuCheckInterval), self.cpu_event)
+        self.supervisor.run(maxRounds)
+
+    def storage_event(self):
+        usbMountDirForm, maxFileDeletions, changeDirAtFailCount = self.supervisorArgs
+        wasFull = self.storageFull
+        self.check_storage(usbMountDirForm, maxFileDeletions)
+        if wasFull and not self.storageFull:
+            for name in self.processes:
+                self.supervisor.wake(name)
+        return get_next_tick(time.time(), self.storageCheckInterval)
+
+    def stream_event(self, name):
+        usbMountDirForm, maxFileDeletions, changeDirAtFailCount = self.supervisorArgs
+        stream = self.processes[name]
+        if not stream.isRecording:
+            self.check_storage(usbMountDirForm, maxFileDeletions)       # the last file may have filled the disk
+        if self.storageFull:
+            return None             # storage_event wakes the stream once there is space again
+        self.mainLogger.debug("Checking stream {}".format(name))
+        self.check_stream(name, stream)
+        if stream.consecutiveFailCount >= changeDirAtFailCount:
+            self.check_fail_count(usbMountDirForm, changeDirAtFailCount)
+        return self.get_next_check(name, stream)
+
+    def cpu_event(self):
+        self.plan_cpu()
+        return get_next_tick(time.time(), self.cpuCheckInterval)
+
+    def sender_event(self, infoSender):
+        infoSender.check_sender()
+        return infoSender.get_next_send()
+
+    def get_next_check(self, name, stream, now=None):
+        """Get the time the stream next needs to be looked at. Growth checks are
+        lined up on multiples of the check interval so all the streams share
+        the same wake ups.
+        """
+        now = time.time() if now is None else now
+        nextCheck = stream.get_next_transition(now)
+        if stream.isActive:
+            if name in self.streamStarts and stream.isStarting and now - self.streamStarts[name] < self.initTime:
+                check = self.streamStarts[name] + self.initTime
+            else:
+                check = get_next_tick(now, stream.checkInterval)
+            nextCheck = check if nextCheck is None else min(nextCheck, check)
+        return nextCheck
+
     #------------------------------------------------------------
     # End Stream Managing Functions
     #============================================================
 
+# how far a transcoding stream is degraded to save CPU
+CPU_FULL = 0            # as configured
+CPU_REDUCED = 1         # half the frame rate
+CPU_COPY = 2            # no encoding, the camera's stream is copied
+COPY_CPU_COST = 0.05    # cores used to copy a stream (until measured)
+ENCODE_CPU_COST = 1.0   # cores used to encode a stream (until measured)
+
+def get_next_tick(now, interval):
+    # the next multiple of interval after now
+    return (math.floor(now / interval) + 1) * interval
+
 class ProcessManager(object):
     def __init__(self, dvrName, streamName, storagePath, container, recordingSchedule, createFilename=False,
                  logLocation='../logs', logLevel='INFO', initTime=15, endAtDuration=False):
@@ -244,8 +412,25 @@ class ProcessManager(object):
         self.createFilename = createFilename
         self.recordingName = "{0}_{1}".format(self.dvrName, self.streamName)
         self.processLogName = os.path.join(self.logLocation, 'process_{}_{}.log'.format(self.streamName, time.strftime('%Y%m%d')))
+        self.processOutput = processoutput.ProcessOutput(self.processLogName)
+        self.progress = None
         self.avgFileSize = 0
         self.thread = None
+        self.supervisor = None
+        self.engine = None
+        self.overlapSeconds = 0                 # start the next file this many seconds before the current one ends (0 to disable)
+        self.handOffTime = None
+        self.processEnded = threading.Event()
+        self.readyEvent = threading.Event()         # set when something happens that may make a new process ready
+        self.readyCheckInterval = 0.25
+        self.isStarting = False
+        self.group = None                           # the CameraGroup recording this stream, if it is packed with others
+        self.priority = 0                           # streams with higher priority get CPU first
+        self.cpuLevel = CPU_FULL
+        self.cpuCost = None                         # cores used by the current process
+        self.cpuCosts = {}                          # average cores used at each CPU level
+        self.lastCpuSample = None
+        self.restartRequested = False
         self.currentFile = None
         self.lastFile = None
         self.isActive = self.should_record()
@@ -266,15 +451,152 @@ class ProcessManager(object):
     def start_recording(self, path=''):
         if path != '':
             self.storagePath = path
-        self.thread = threading.Thread(target=self.record)
+        self.isStarting = True
+        if self.group is not None:
+            self.lastThreadStart = time.time()
+            self.group.start_recording()
+            return
+        if self.engine is not None:
+            self.thread = None
+            self.engine.start_recording(self)
+            self.lastThreadStart = time.time()
+            self.logger.debug("Coroutine for stream {} started!".format(self.streamName))
+            return
+        self.thread = threading.Thread(target=self.run_recording)
         self.thread.daemon = True
         self.thread.start()
         self.lastThreadStart = time.time()
         self.logger.debug("Thread for stream {} started!".format(self.streamName))
 
+    def run_recording(self):
+        try:
+            self.record()
+        finally:
+            self.recording_ended()
+
+    def is_transcoding(self): # NOTE: overloaded in CameraRecorder
+        return False
+
+    def measure_cpu(self):
+        """Update the cores used by the recording process from its CPU time
+        since the last call. Returns None until there are two samples.
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.lastCpuSample = None
+            self.cpuCost = None
+            return None
+        cpuTime = dvrutils.get_process_cpu_time(self.process.pid)
+        if cpuTime is None:
+            return None
+        now = time.monotonic()
+        lastSample, self.lastCpuSample = self.lastCpuSample, (self.process.pid, now, cpuTime)
+        if lastSample is None or lastSample[0] != self.process.pid or now <= lastSample[1]:
+            return self.cpuCost
+        self.cpuCost = (cpuTime - lastSample[2]) / (now - lastSample[1])
+        lastCost = self.cpuCosts.get(self.cpuLevel)
+        self.cpuCosts[self.cpuLevel] = self.cpuCost if lastCost is None else 0.7*lastCost + 0.3*self.cpuCost
+        return self.cpuCost
+
+    def estimate_cpu_cost(self, level): # NOTE: overloaded in CameraRecorder
+        return self.cpuCosts.get(level, COPY_CPU_COST)
+
+    def set_cpu_level(self, level):
+        """Change how far the stream is degraded. A degraded stream restarts
+        right away, an upgraded one at its next file.
+        """
+        degrade = level > self.cpuLevel
+        self.logger.info("{} recording to CPU level {}".format('Degrading' if degrade else 'Upgrading', level))
+        self.cpuLevel = level
+        if degrade and self.isRecording:
+            self.restartRequested = True
+
+    def recording_ended(self):
+        self.isStarting = False
+        # let the manager restart the stream right away instead of at its next check
+        if self.supervisor is not None:
+            self.supervisor.wake(self.streamName)
+
+    def run_steps(self, steps):
+        """Run the steps of a recording generator (see record_steps) in this
+        thread, blocking on each one. AsyncEngine runs the same generators as
+        coroutines.
+        """
+        result = None
+        while True:
+            try:
+                step = steps.send(result)
+            except StopIteration as e:
+                return e.value
+            result = self.do_step(step)
+
+    def do_step(self, step):
+        kind = step[0]
+        if kind == 'sleep':
+            time.sleep(step[1])
+        elif kind == 'wait':
+            self.wait_for_check(*step[1:])
+        elif kind == 'spawn':
+            return self.spawn_process(*step[1:])
+        elif kind == 'ready':
+            return self.wait_until_ready(step[1])
+        elif kind == 'call':
+            return step[1](*step[2:])
+        else:
+            raise ValueError('Unknown recording step {}'.format(kind))
+
+    def spawn_process(self, cmd_args, output=None):
+        self.processEnded.clear()
+        self.readyEvent.clear()
+        # all ouptut should go to stderr, but watch stdout too anyways
+        process = subprocess.Popen(cmd_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0, universal_newlines=True)
+        (self.processOutput if output is None else output).watch(process)
+        if self.supervisor is not None:
+            self.supervisor.watch_process(process, self.process_exited)
+        return process
+
+    def process_exited(self):
+        # called by the supervisor
+        self.processEnded.set()
+        self.readyEvent.set()
+
+    def is_ready(self):
+        """Whether the new process has started recording (its file has data in it)."""
+        return self.currentFile is not None and os.path.exists(self.currentFile) and os.path.getsize(self.currentFile) > 0
+
+    def wait_until_ready(self, timeout):
+        """Wait until the new process is ready, exits or timeout seconds pass. Returns True if it is ready."""
+        deadline = time.monotonic() + timeout
+        while not self.is_ready():
+            remaining = deadline - time.monotonic()
+            if self.process.poll() is not None or remaining <= 0:
+                return False
+            self.readyEvent.wait(min(remaining, self.readyCheckInterval))
+            self.readyEvent.clear()
+        return True
+
+    def wait_for_check(self, timeout=None):
+        """Sleep until the next process check, returning early if the supervisor sees the process exit."""
+        timeout = self.checkInterval if timeout is None else timeout
+        if self.supervisor is None:
+            time.sleep(timeout)
+        else:
+            self.processEnded.wait(timeout)
+
+    def get_check_wait(self):
+        # wake up in time for a hand off if one is planned before the next check
+        if self.handOffTime is None:
+            return self.checkInterval
+        return min(self.checkInterval, max(self.handOffTime - time.time(), 0))
+
+    def get_next_transition(self, atTime=None):
+        """Get the time should_record may next change its answer (None if never)."""
+        return self.recordingSchedule.get_next_transition(atTime)
+
     def thread_isAlive(self):
+        if self.group is not None:
+            return self.group.thread_isAlive()
         self.timeSinceThreadStart = time.time() - self.lastThreadStart
-        if self.timeSinceThreadStart < self.initTime:
+        if self.isStarting and self.timeSinceThreadStart < self.initTime:
             # give process a chance to warm up before we let anyone know it's real status
             self.logger.info("Stream {} is still warming up...".format(self.streamName))
             return True
@@ -338,7 +660,7 @@ class ProcessManager(object):
             return True
         self.timeSinceStart = time.time() - self.startTime
         self.logger.debug("Process was started {} seconds ago".format(self.timeSinceStart))
-        if self.timeSinceStart < self.initTime: # wait until ffmpeg is initialized
+        if self.isStarting and self.timeSinceStart < self.initTime: # wait until ffmpeg is initialized
             self.logger.debug("Skipping growth check until process has {} seconds to warm up".format(self.initTime))
             return True
         if self.process is not None:
@@ -349,7 +671,7 @@ class ProcessManager(object):
                 pstat = self.process.poll()
                 if pstat is None:
                     self.logger.error("The file has not been created {} seconds past start! Killing process now to (hopefully) restart correctly!".format(round(self.timeSinceStart)))
-                    dvrutils.kill_process(self.process, self.logger)
+                    dvrutils.kill_process(self.process, self.logger, wait=False)
                     self.reset()                                    # restart the stream status so a new recording starts
                     return False
                 else:
@@ -373,7 +695,7 @@ class ProcessManager(object):
                     if self.noGrowthCount >= self.killAtErrorCount:
 
                         self.logger.error("The file being recorded has not grown for {} seconds (after {} checks). Killing process to restart now!".format(self.noGrowthCount*self.checkInterval,self.noGrowthCount))
-                        dvrutils.kill_process(self.process, self.logger)
+                        dvrutils.kill_process(self.process, self.logger, wait=False)
                         self.reset()
                         return False
 
@@ -388,55 +710,80 @@ class ProcessManager(object):
     def reset(self):
         self.logger.info("Resetting stream status parameters for new recording...")
         if self.process and self.process.poll() is None:
-            self.logger.warning("Process was still running. Killing it now...")
-            dvrutils.kill_process(self.process, self.logger)
+            self.logger.warning("Process was still running. Killing it now...")      # in the background, the recording loop waits for it to end
+            dvrutils.kill_process(self.process, self.logger, wait=False)
+        self.reset_growth_check()
+        self.logger.debug("Stream reset complete!")
+
+    def reset_growth_check(self):
+        # forget what the growth check knows about the last file
         self.lastSize = 0
         self.fileSize = []
         self.noGrowthCount = 0
         self.fileGrowthRate = 0
-        self.logger.debug("Stream reset complete!")
 
     def build_command(self):
         raise NotImplementedError('build_command() is not overridden')
 
     def initialize_recording(self, duration):
+        return self.run_steps(self.initialize_steps(duration))
+
+    def initialize_steps(self, duration):
         self.startTime = time.time()
         self.cmd_args = self.build_command(duration)
         self.logger.debug('The command arguments are the following {}'.format(self.cmd_args))
         self.logger.info("Starting recording stream {} for {} seconds.".format(self.streamName, duration))
+        self.processOutput.flush()
+        if self.progress is not None:
+            self.progress.reset()
         with open(self.processLogName, 'a') as f:
             f.write('### PROCESS LOG FOR PROCESS {} ###\n\n'.format(self.currentFile if self.createFilename else 'Unknown'))
-        try:
-            # all ouptut should go to stderr, but watch stdout too anyways
-            self.process = subprocess.Popen(self.cmd_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0, universal_newlines=True)
-        except Exception as f:
-            raise f
+        self.process = yield ('spawn', self.cmd_args)
         self.timeSinceStart = 0
-        self.logger.debug("Recording for stream {} started! Sleeping for {} seconds before performing a process check...".format(self.streamName, self.initTime))
-        time.sleep(self.initTime)
+        self.logger.debug("Recording for stream {} started! Waiting up to {} seconds for it to become ready...".format(self.streamName, self.initTime))
+        isReady = yield ('ready', self.initTime)
+        self.isStarting = False
         self.logger.debug("Checking process status on stream {}".format(self.streamName))
         self.timeSinceStart = time.time() - self.startTime
         pstat = self.process.poll()
+        if pstat is None and not isReady:
+            self.logger.warning("Stream {} did not show any sign of recording within {} seconds!".format(self.streamName, self.initTime))
         self.logger.debug("Process on stream {} is {} {} seconds after start".format(self.streamName, 'active' if pstat is None else 'INactive', self.timeSinceStart))
         self.stopTime = self.startTime + duration if self.endAtDuration else self.startTime + duration + 60
         return pstat
 
     def rename_file(self, dateStr, startTimeStr):
         endTimeStr = time.strftime("%H%M%S")
-        newFname = self.format_file_name(dateStr, startTimeStr, endTimeStr, unique=False)
-        if newFname != self.currentFile:
-            self.lastFile = dvrutils.get_unique_filename(newFname)
-            self.logger.info("Renaming file {} to {} to reflect true end time...".format(self.currentFile,self.lastFile))
-            try:
-                os.rename(self.currentFile, self.lastFile)
-            except Exception as e:
-                self.logger.error(e)
-                self.logger.error("Could not rename file {}! This is probably not good...".format(self.currentFile))
-                self.lastFile = self.currentFile
-        else:
-            self.lastFile = self.currentFile
+        self.lastFile = self.rename_finished_file(self.currentFile, dateStr, startTimeStr, endTimeStr)
         self.currentFile = self.lastFile
 
+    def rename_finished_file(self, fileName, dateStr, startTimeStr, endTimeStr):
+        """Rename a finished recording so its name reflects the true end time.
+        Returns the new file name (or the old one if it could not be renamed).
+        """
+        newFname = self.format_file_name(dateStr, startTimeStr, endTimeStr, unique=False)
+        if newFname == fileName:
+            return fileName
+        newFname = dvrutils.get_unique_filename(newFname)
+        self.logger.info("Renaming file {} to {} to reflect true end time...".format(fileName, newFname))
+        try:
+            os.rename(fileName, newFname)
+        except Exception as e:
+            self.logger.error(e)
+            self.logger.error("Could not rename file {}! This is probably not good...".format(fileName))
+            return fileName
+        for companion, newCompanion in zip(self.get_companion_files(fileName), self.get_companion_files(newFname)):
+            if os.path.exists(companion):
+                try:
+                    os.rename(companion, newCompanion)
+                except Exception as e:
+                    self.logger.error("Could not rename file {}: {}".format(companion, e))
+        return newFname
+
+    def get_companion_files(self, fileName): # NOTE: overloaded in CameraRecorder
+        """Get the other files written alongside the recording fileName, which are renamed with it."""
+        return []
+
     def stop_recording(self):
         pstat = self.process.poll()
         if pstat is None:
@@ -446,21 +793,33 @@ class ProcessManager(object):
                 self.logger.warning("Process was caught running well past the point it should have stopped! Killing it now!")
             dvrutils.kill_process(self.process, self.logger)
             self.reset()
+        self.processOutput.flush()
         with open(self.processLogName, 'a') as f:
             f.write('### END PROCESS LOG FOR PROCESS {} ###\n\n'.format(self.currentFile if self.createFilename else 'Unknown'))
     
-    def get_recording_duration(self):
-        """Get the amount of time to record given the current time."""
-        return self.recordingSchedule.get_recording_duration()
+    def get_recording_duration(self, atTime=None):
+        """Get the amount of time to record given the current time (or atTime)."""
+        return self.recordingSchedule.get_recording_duration(atTime)
+
+    def get_ingest_metrics(self):
+        """Get the live metrics of the running process (empty if it does not report progress)."""
+        if self.group is not None:
+            return self.group.get_ingest_metrics()
+        if self.progress is None:
+            return {}
+        return self.progress.get_metrics()
     
     def record(self):
+        return self.run_steps(self.record_steps())
+
+    def record_steps(self):
         # reset the recording parameters
         self.logger.debug("Entered record...")
-        self.reset()
+        yield ('call', self.reset)
         self.cmd_args = []
         self.logger.debug("Checking recording schedule...")
 
-        if self.should_record():
+        if (yield ('call', self.should_record)):
             self.logger.debug("Stream {} should record now!".format(self.streamName))
             self.isRecording = True
             self.startTime = time.time()
@@ -474,27 +833,38 @@ class ProcessManager(object):
                     time.strftime("%Y%m%d"), time.strftime("%H%M%S"), time.strftime("%H%M%S",time.localtime(time.time()+duration))
 
                 self.logger.debug("Formatting file name...")
-                self.currentFile = self.format_file_name(dateStr, startTimeStr, endTimeStr)
+                self.currentFile = self.new_file_name(dateStr, startTimeStr, endTimeStr)
             else:
                 self.createFilename = None
 
-            pstat = self.initialize_recording(duration)
+            pstat = yield from self.initialize_steps(duration)
+            self.plan_hand_off(duration)
             self.logger.debug("Entering process check loop on stream {} until planned stop time ~{}".format(self.streamName, time.strftime("%H:%M:%S", time.localtime(self.stopTime))))
             while pstat is None:
                 self.logger.debug("Waiting {} seconds until next check...".format(self.checkInterval))
-                time.sleep(self.checkInterval)
+                yield ('wait', self.get_check_wait())
                 self.log_process_output()
+                if self.handOffTime is not None and time.time() >= self.handOffTime:
+                    nextFile = yield from self.hand_off_steps(dateStr, startTimeStr, duration)
+                    if nextFile is not None:
+                        dateStr, startTimeStr, duration = nextFile
+                        self.plan_hand_off(duration)
                 self.timeSinceStart = time.time() - self.startTime
                 self.logger.debug("Checking process timeliness...")
-                if time.time() > self.stopTime:
-                    self.stop_recording()
+                if time.time() > self.stopTime or self.restartRequested:
+                    yield ('call', self.stop_recording)
                 pstat = self.process.poll()
+            self.handOffTime = None
 
-            if pstat == 0:
+            if self.restartRequested:
+                self.logger.info("Recording {} stopped at {} to restart with new settings".format(self.streamName, time.strftime("%H:%M:%S")))
+                self.restartRequested = False
+            elif pstat == 0:
                 self.logger.info("Recording {} completed at {}!".format(self.streamName, time.strftime("%H:%M:%S")))
                 self.consecutiveFailCount = 0
             else:
                 self.logger.error("Recording {} exited at {} with returncode {}!".format(self.streamName, time.strftime("%H:%M:%S"), pstat))
+                self.log_last_output()
                 self.consecutiveFailCount += 1
             if self.currentFile is not None:
                 self.rename_file(dateStr, startTimeStr)
@@ -502,11 +872,85 @@ class ProcessManager(object):
             # sync the disk(s) to make sure everything is written to storage
             self.logger.info("Recording file {} ended!".format(self.streamName))
             self.logger.debug("Syncing disk buffers...")
-            subprocess.call(['sync'])
+            yield ('call', subprocess.call, ['sync'])
             self.isRecording = False
             self.logger.debug("Exiting camera_record...")
             return self.lastFile if self.createFilename else False
 
+    def plan_hand_off(self, duration):
+        # hand off to the next process overlapSeconds before this one ends, if the stream records past its end
+        self.handOffTime = None
+        if self.overlapSeconds > 0 and self.createFilename:
+            endTime = self.startTime + duration
+            if self.recordingSchedule.check_recording_schedule(endTime):
+                self.handOffTime = endTime - self.overlapSeconds
+
+    def hand_off_steps(self, dateStr, startTimeStr, duration):
+        """Start the next recording while the current one is still running and
+        stop the current one once the new file is growing, so there is no gap
+        between the files. Returns the (dateStr, startTimeStr, duration) of the
+        new recording, or None if the new process did not come up (in which
+        case the current one carries on until its end).
+        """
+        self.handOffTime = None
+        now = time.time()
+        endTime = self.startTime + duration
+        nextDuration = int(round(endTime - now)) + self.get_recording_duration(endTime)
+        nextDateStr, nextStartTimeStr = time.strftime("%Y%m%d", time.localtime(now)), time.strftime("%H%M%S", time.localtime(now))
+        nextFile = self.format_file_name(nextDateStr, nextStartTimeStr, time.strftime("%H%M%S", time.localtime(now + nextDuration)))
+        nextOutput = processoutput.ProcessOutput(self.processLogName)
+        if self.progress is not None:
+            nextOutput.progress = processoutput.ProgressTracker()
+        cmd_args = self.build_command(nextDuration, nextFile)
+        self.logger.info("Handing off stream {} to a new recording for {} seconds.".format(self.streamName, nextDuration))
+        with open(self.processLogName, 'a') as f:
+            f.write('### PROCESS LOG FOR PROCESS {} ###\n\n'.format(nextFile))
+        nextProcess = yield ('spawn', cmd_args, nextOutput)
+
+        # wait for the new file to grow before letting go of the old one
+        lastSize, isGrowing = 0, False
+        for _ in range(int(math.ceil(self.overlapSeconds + self.initTime))):
+            yield ('sleep', 1)
+            if nextProcess.poll() is not None:
+                break
+            size = os.path.getsize(nextFile) if os.path.exists(nextFile) else 0
+            if size > lastSize > 0:
+                isGrowing = True
+                break
+            lastSize = size
+        if not isGrowing:
+            self.logger.warning("The next recording did not start growing, keeping the current one until it ends!")
+            if nextProcess.poll() is None:
+                yield ('call', dvrutils.kill_process, nextProcess, self.logger)
+            nextOutput.flush()
+            for f in [nextFile] + self.get_companion_files(nextFile):
+                if os.path.exists(f) and os.path.getsize(f) == 0:
+                    os.remove(f)
+            return None
+
+        # the new recording is running, finish the old one
+        if self.process.poll() is None:
+            yield ('call', dvrutils.kill_process, self.process, self.logger)
+        self.processOutput.flush()
+        with open(self.processLogName, 'a') as f:
+            f.write('### END PROCESS LOG FOR PROCESS {} ###\n\n'.format(self.currentFile))
+        self.rename_file(dateStr, startTimeStr)
+        self.logger.info("Recording file {} ended, recording continues in {}!".format(self.lastFile, nextFile))
+        self.consecutiveFailCount = 0
+
+        self.process = nextProcess
+        self.processOutput = nextOutput
+        self.progress = nextOutput.progress
+        self.currentFile = nextFile
+        self.startTime = now
+        self.stopTime = now + nextDuration if self.endAtDuration else now + nextDuration + 60
+        self.reset_growth_check()
+        yield ('call', subprocess.call, ['sync'])
+        return nextDateStr, nextStartTimeStr, nextDuration
+
+    def new_file_name(self, dateStr, startTimeStr, endTimeStr): # NOTE: overloaded in CameraGroup
+        return self.format_file_name(dateStr, startTimeStr, endTimeStr)
+
     def format_file_name(self, dateStr, startTimeStr, endTimeStr, unique=True):
         fileName = "{rn}-{ds}_{st}-{et}.{vc}".format(rn=self.recordingName,
                                                      ds=dateStr,
@@ -518,8 +962,15 @@ class ProcessManager(object):
             fileName = dvrutils.get_unique_filename(fileName)
         return fileName
 
-    def log_process_output(self): # NOTE: overloaded in CameraRecorder
-        pass # Was not implemented for CommandRecorder becuase of issues with stalling
+    def log_process_output(self):
+        # the output is read in the background, just make sure everything read so far is in the log
+        self.logger.debug('Outputing to process log')
+        self.processOutput.flush()
+
+    def log_last_output(self, nLines=10):
+        lines = self.processOutput.get_recent_lines(nLines)
+        if len(lines) > 0:
+            self.logger.error("Last {} lines of process output:\n{}".format(len(lines), ''.join(lines).rstrip()))
 
 class CameraRecorder(ProcessManager):
 
@@ -527,7 +978,8 @@ class CameraRecorder(ProcessManager):
                  recordingSchedule, videoLocation, ffmpegLogLevel='warning', ffmpegLogFileForm='ffmpeg.log',
                  logLocation='../logs/', logLevel='INFO', initTime=15, endAtDuration=False,
                  performRestarts=False, user=None, passwd=None, manufacturer=None, ipAddr=None, port=None,
-                 onvifDir=None, streamType=None):
+                 onvifDir=None, streamType=None, segmentFiles=False, overlapSeconds=0, proxyContainer=None,
+                 proxyCodec='libx264', proxyWidth=320, proxyFrameRate=5, snapshotSeconds=0, priority=0):
         self.lastReboot = time.strftime('%Y%m%d') # These need to be set before super is called, so should_record can get called in PM ctor
         self.isRestarting = False
         self.continueRecordingPast = 0
@@ -549,6 +1001,22 @@ class CameraRecorder(ProcessManager):
         self.port = port
         self.onvifDir = onvifDir
         self.streamType = streamType
+        self.segmentFiles = segmentFiles
+        self.overlapSeconds = overlapSeconds
+        self.proxyContainer = proxyContainer        # container of the low resolution copy (None for no copy)
+        self.proxyCodec = proxyCodec
+        self.proxyWidth = proxyWidth
+        self.proxyFrameRate = proxyFrameRate
+        self.snapshotSeconds = snapshotSeconds      # how often to update the snapshot image (0 for never)
+        self.priority = priority
+        self.segmentListName = None
+        self.segmentListPos = 0
+        self.progress = processoutput.ProgressTracker()
+        self.progress.onUpdate = self.readyEvent.set
+        self.processOutput.progress = self.progress
+        self.stallTimeout = 10
+        self.lastOutTime = None
+        self.segmentRegex = re.compile(r'^{}-(\d{{8}})_(\d{{6}})\.{}$'.format(re.escape(self.recordingName), re.escape(self.container)))
         if self.manufacturer != None and self.manufacturer.lower() != 'axis' and self.performRestarts:
             self.set_camera_time()
         self.getStreamType()
@@ -583,56 +1051,274 @@ class CameraRecorder(ProcessManager):
         # pretty rare in our applications, but who knows...)
         if self.isHlsDash():
             self.killAtErrorCount = 20
-            self.logger.debug("Upping killAtErrorCount to {} ...".format(
-                self.killAtErrorCount))
+            self.stallTimeout = 60
+            self.logger.debug("Upping killAtErrorCount to {} and stallTimeout to {} ...".format(
+                self.killAtErrorCount, self.stallTimeout))
     
     def isHlsDash(self):
         """Return if the stream is HLS/DASH."""
         return self.streamType in ['HLS', 'DASH']
     
-    def get_recording_duration(self):
-        """Get the amount of time to record given the current time. Runs some
-        additional checks on HLS/DASH recordings to try and prevent small
-        clips at the ends of recording intervals.
+    def get_recording_duration(self, atTime=None):
+        """Get the amount of time to record given the current time (or atTime).
+        Runs some additional checks on HLS/DASH recordings to try and prevent
+        small clips at the ends of recording intervals.
         """
         # get the "standard" duration
-        dur = self.recordingSchedule.get_recording_duration()
+        dur = self.recordingSchedule.get_recording_duration(atTime)
         
         # if HLS/DASH, check if the clip will be too short (defined as less
         # than 60 seconds, as long as clips are not 1-minute clips)
         if self.isHlsDash() and dur < 60 and self.recordingSchedule.fileDurationMinutes != 1:
             self.logger.info("Clip duration {} too short! Merging with next clip!".format(dur))
             extraDur = dur + 1
-            atTime = time.time() + extraDur
+            atTime = (time.time() if atTime is None else atTime) + extraDur
             dur2 = self.recordingSchedule.get_recording_duration(atTime=atTime)
             return dur2 + extraDur
         return dur
     
-    def build_command(self, videoDuration):
+    def build_command(self, videoDuration, fileName=None):
         self.logger.debug("Building ffmpeg command string...")
-        cmd_args = []
+        inputArgs = self.build_input_args()
+        if len(inputArgs) == 0:
+            return []
+        # live progress goes to stdout, where the output reader parses it
+        return (['ffmpeg', '-progress', 'pipe:1', '-y', '-loglevel', self.ffmpegLogLevel] + inputArgs +
+                self.build_codec_args() + self.build_output_args(videoDuration, fileName))
+
+    def build_input_args(self):
+        """Get the ffmpeg arguments that open the camera stream."""
         if self.streamType == 'RTSP':
-            cmd_args = ['ffmpeg', '-y', '-use_wallclock_as_timestamps', '1', '-loglevel', self.ffmpegLogLevel,
-                             '-rtsp_transport', 'tcp', '-stimeout', '5000000', '-i', self.streamURL, '-c:v', self.codec,
-                             '-r', str(self.framerate), '-t', str(videoDuration), self.currentFile]
+            return ['-use_wallclock_as_timestamps', '1', '-rtsp_transport', 'tcp', '-stimeout', '5000000', '-i', self.streamURL]
         elif self.isHlsDash():
-            # NOTE that we don't set a framerate for HLS/DASH
-            cmd_args = ['ffmpeg', '-y', '-loglevel', self.ffmpegLogLevel, '-i', self.streamURL,
-                        '-c', self.codec, '-t', str(videoDuration), self.currentFile]
+            return ['-i', self.streamURL]
         elif self.streamType == 'MJPEG':
-            cmd_args = ['ffmpeg', '-y', '-use_wallclock_as_timestamps', '1', '-loglevel', self.ffmpegLogLevel,
-                             '-f', 'mjpeg', '-i', self.streamURL, '-c:v', self.codec, '-qscale:v', str(self.quality),
-                             '-r', str(self.framerate), '-t', str(videoDuration), self.currentFile]
-        return cmd_args
+            return ['-use_wallclock_as_timestamps', '1', '-f', 'mjpeg', '-i', self.streamURL]
+        return []
 
-    def log_process_output(self):
-        self.logger.debug('Outputing to process log')
-        with open(self.processLogName, 'a') as logFile:
-            for oLine in self.process.stdout:
-                eptime = time.time()
-                ms = int(1000*(eptime-math.floor(eptime)))
-                logFile.write(time.strftime("%H:%M:%S,{} -- ".format(ms))+oLine)
-        self.logger.debug('Output to process log finished')
+    def build_codec_args(self):
+        codec = 'copy' if self.cpuLevel >= CPU_COPY else self.codec
+        framerate = max(1, int(self.framerate) // 2) if self.cpuLevel == CPU_REDUCED else self.framerate
+        if self.streamType == 'RTSP':
+            return ['-c:v', codec, '-r', str(framerate)]
+        elif self.isHlsDash():
+            # NOTE that we don't set a framerate for HLS/DASH
+            return ['-c', codec]
+        return ['-c:v', codec, '-qscale:v', str(self.quality), '-r', str(framerate)]
+
+    def is_transcoding(self):
+        return self.codec != 'copy'
+
+    def estimate_cpu_cost(self, level):
+        """Get the cores the stream is expected to use at a CPU level, from
+        what was measured at that level or (scaled) at the others.
+        """
+        if level in self.cpuCosts:
+            return self.cpuCosts[level]
+        if level == CPU_COPY or not self.is_transcoding():
+            return COPY_CPU_COST
+        if CPU_FULL in self.cpuCosts:
+            fullCost = self.cpuCosts[CPU_FULL]
+        elif CPU_REDUCED in self.cpuCosts:
+            fullCost = 2*self.cpuCosts[CPU_REDUCED]          # encoding cost goes with the frame rate
+        else:
+            fullCost = ENCODE_CPU_COST
+        return fullCost if level == CPU_FULL else fullCost / 2.0
+
+    def can_be_packed(self):
+        """Whether this stream can share an ffmpeg process with other cameras
+        (it only copies the stream into plain files, one per process).
+        """
+        return (self.codec == 'copy' and len(self.build_input_args()) > 0 and not self.segmentFiles and self.overlapSeconds == 0
+                and not self.proxyContainer and self.snapshotSeconds == 0 and not self.performRestarts)
+
+    def build_output_args(self, videoDuration, fileName=None):
+        """Get the output part of the ffmpeg command: the recording, then the
+        low resolution copy and the snapshot if they are turned on, all from
+        the one connection to the camera.
+        """
+        fileName = self.currentFile if fileName is None else fileName
+        outputArgs = self.build_file_args(videoDuration, fileName, self.get_segment_pattern(), self.segmentListName)
+        if self.proxyContainer:
+            outputArgs += ['-map', '0:v', '-c:v', self.proxyCodec, '-vf', 'scale={}:-2'.format(self.proxyWidth),
+                           '-r', str(self.proxyFrameRate), '-an'] + self.build_file_args(
+                               videoDuration, self.get_proxy_name(fileName), self.get_proxy_name(self.get_segment_pattern()))
+        if self.snapshotSeconds > 0:
+            outputArgs += ['-map', '0:v', '-vf', 'fps=1/{}'.format(self.snapshotSeconds), '-q:v', '2', '-f', 'image2',
+                           '-update', '1', '-t', str(videoDuration), self.get_snapshot_name()]
+        return outputArgs
+
+    def build_file_args(self, videoDuration, fileName, segmentPattern, segmentList=None):
+        """Get the arguments for one recorded output. In segment mode the
+        segment muxer cuts a new file named by segmentPattern at every clock
+        boundary of the schedule (appending each finished file to segmentList,
+        if given).
+        """
+        if not self.segmentFiles:
+            return ['-t', str(videoDuration), fileName]
+        segmentArgs = ['-t', str(videoDuration), '-f', 'segment',
+                       '-segment_time', str(int(self.recordingSchedule.fileDurationMinutes)*60),
+                       '-segment_atclocktime', '1', '-reset_timestamps', '1', '-strftime', '1']
+        if segmentList is not None:
+            segmentArgs += ['-segment_list', segmentList, '-segment_list_type', 'csv']
+        return segmentArgs + [segmentPattern]
+
+    def get_proxy_name(self, fileName):
+        """Get the name of the low resolution copy of the recording fileName."""
+        return "{}-proxy.{}".format(os.path.splitext(fileName)[0], self.proxyContainer)
+
+    def get_snapshot_name(self):
+        return os.path.join(self.storagePath, dvrutils.SNAPSHOT_NAME)
+
+    def get_companion_files(self, fileName):
+        return [self.get_proxy_name(fileName)] if self.proxyContainer else []
+
+    def check_file_growth(self):
+        """Check that the recording is still advancing. Uses the media time
+        from ffmpeg's progress output once it is available, falling back to
+        checking the size of the file until then.
+        """
+        if self.startTime is None or self.process is None or self.progress.updateCount == 0:
+            return super(CameraRecorder, self).check_file_growth()
+        metrics = self.progress.get_metrics()
+        if metrics['bitrate'] is not None:
+            self.fileGrowthRate = metrics['bitrate']*1000/8.0
+        stalledFor = metrics['stalledFor']
+        if stalledFor >= self.stallTimeout and self.process.poll() is None:
+            self.logger.error("The media time of the recording has not advanced for {} seconds. Killing process to restart now!".format(round(stalledFor)))
+            dvrutils.kill_process(self.process, self.logger, wait=False)
+            self.reset()
+            return False
+        isGrowing = self.lastOutTime is None or (metrics['outTime'] is not None and metrics['outTime'] > self.lastOutTime)
+        self.lastOutTime = metrics['outTime']
+        self.logger.debug("Recording is at {} seconds of media time ({} fps, {} frames dropped)".format(
+            metrics['outTime'], metrics['fps'], metrics['dropFrames']))
+        return isGrowing
+
+    def is_ready(self):
+        # ffmpeg only reports progress once the camera is connected and the output is open
+        return self.progress.updateCount > 0 or super(CameraRecorder, self).is_ready()
+
+    def reset_growth_check(self):
+        self.lastOutTime = None
+        super(CameraRecorder, self).reset_growth_check()
+
+    def get_segment_pattern(self):
+        """Get the strftime pattern the segment muxer uses for new files."""
+        pattern = "{rn}-%Y%m%d_%H%M%S.{vc}".format(rn=self.recordingName.replace('%', '%%'), vc=self.container)
+        return os.path.join(self.storagePath, pattern)
+
+    def record_steps(self):
+        if self.segmentFiles:
+            return (yield from self.record_segment_steps())
+        return (yield from super(CameraRecorder, self).record_steps())
+
+    def record_segments(self):
+        return self.run_steps(self.record_segment_steps())
+
+    def record_segment_steps(self):
+        """Record the rest of the active period with a single ffmpeg process.
+        Finished segments are picked up from the segment list and renamed to
+        the usual name-date_start-end format.
+        """
+        self.logger.debug("Entered record_segments...")
+        yield ('call', self.reset)
+        self.cmd_args = []
+        self.logger.debug("Checking recording schedule...")
+
+        if (yield ('call', self.should_record)):
+            self.logger.debug("Stream {} should record now!".format(self.streamName))
+            self.isRecording = True
+            self.startTime = time.time()
+            duration = self.recordingSchedule.get_active_duration()
+            self.logger.debug("Stream will record {} second segments for {} seconds!".format(
+                int(self.recordingSchedule.fileDurationMinutes)*60, duration))
+
+            # start with an empty segment list so only files from this process are picked up
+            self.currentFile = None
+            self.segmentListName = os.path.join(self.storagePath, '.{}.segments'.format(self.recordingName))
+            self.segmentListPos = 0
+            open(self.segmentListName, 'w').close()
+
+            pstat = yield from self.initialize_steps(duration)
+            yield ('call', self.collect_segments)
+            self.logger.debug("Entering process check loop on stream {} until planned stop time ~{}".format(self.streamName, time.strftime("%H:%M:%S", time.localtime(self.stopTime))))
+            while pstat is None:
+                self.logger.debug("Waiting {} seconds until next check...".format(self.checkInterval))
+                yield ('wait',)
+                self.log_process_output()
+                yield ('call', self.collect_segments)
+                self.timeSinceStart = time.time() - self.startTime
+                if time.time() > self.stopTime:
+                    yield ('call', self.stop_recording)
+                pstat = self.process.poll()
+
+            if pstat == 0:
+                self.logger.info("Segment recording {} completed at {}!".format(self.streamName, time.strftime("%H:%M:%S")))
+                self.consecutiveFailCount = 0
+            else:
+                self.logger.error("Segment recording {} exited at {} with returncode {}!".format(self.streamName, time.strftime("%H:%M:%S"), pstat))
+                self.log_last_output()
+                self.consecutiveFailCount += 1
+            yield ('call', functools.partial(self.collect_segments, processEnded=True))
+            self.isRecording = False
+            self.logger.debug("Exiting record_segments...")
+            return self.lastFile
+
+    def collect_segments(self, processEnded=False):
+        """Rename the segments ffmpeg finished since the last call and point
+        currentFile at the segment being written. Once the process has ended,
+        any segment that never made it into the list is finished too.
+        """
+        finished = []
+        try:
+            with open(self.segmentListName, 'rb') as f:
+                f.seek(self.segmentListPos)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break               # ffmpeg is still writing this entry
+                    self.segmentListPos += len(line)
+                    entry = line.decode().strip().split(',')[0].strip('"')
+                    if entry != '':
+                        finished.append(os.path.join(self.storagePath, os.path.basename(entry)))
+        except (IOError, OSError):
+            self.logger.warning("Could not read segment list {}!".format(self.segmentListName))
+
+        if processEnded:
+            finished += [f for f in self.get_unfinished_segments() if f not in finished]
+        elif len(finished) > 0 or self.currentFile is None:
+            # switch to the new file before renaming the old one so the growth check never loses track of it
+            unfinished = [f for f in self.get_unfinished_segments() if f not in finished]
+            self.currentFile = unfinished[-1] if len(unfinished) > 0 else None
+            self.lastSize = 0
+            self.fileSize = []
+
+        for fileName in finished:
+            self.finish_segment(fileName)
+        if len(finished) > 0:
+            if processEnded:
+                self.currentFile = self.lastFile
+            self.logger.debug("Syncing disk buffers...")
+            subprocess.call(['sync'])
+        return finished
+
+    def get_unfinished_segments(self):
+        """Get the segment files that have not been renamed yet, oldest first."""
+        try:
+            names = os.listdir(self.storagePath)
+        except OSError:
+            return []
+        return sorted(os.path.join(self.storagePath, n) for n in names if self.segmentRegex.match(n))
+
+    def finish_segment(self, fileName):
+        match = self.segmentRegex.match(os.path.basename(fileName))
+        if match is None or not os.path.exists(fileName):
+            self.logger.warning("Segment {} is missing or misnamed, skipping it!".format(fileName))
+            return
+        dateStr, startTimeStr = match.groups()
+        endTimeStr = time.strftime("%H%M%S", time.localtime(os.path.getmtime(fileName)))
+        self.lastFile = self.rename_finished_file(fileName, dateStr, startTimeStr, endTimeStr)
+        self.logger.info("Recording file {} ended!".format(self.lastFile))
 
     def set_camera_time(self, camera=None):
         try:
@@ -713,6 +1399,16 @@ class CameraRecorder(ProcessManager):
                 self.logger.warning('Reboot failed on try {}/{} with status {}'.format(tries, stopAtCount, status))
                 time.sleep(60)
 
+    def get_next_transition(self, atTime=None):
+        # also wake up for the daily restart and the end of a restart pause
+        atTime = time.time() if atTime is None else atTime
+        currTime = time.localtime(atTime)
+        nextTimes = [atTime - (currTime.tm_hour*3600 + currTime.tm_min*60 + currTime.tm_sec) + 86400]
+        nextTimes.append(self.recordingSchedule.get_next_transition(atTime))
+        if self.continueRecordingPast > atTime:
+            nextTimes.append(self.continueRecordingPast)
+        return min(t for t in nextTimes if t is not None)
+
     def should_record(self):
         self.logger.debug('Checking if camera should restart...')
         # if the camera hasn't been restarted yet today, restart it
@@ -723,6 +1419,90 @@ class CameraRecorder(ProcessManager):
             return False
         return self.recordingSchedule.check_recording_schedule()
 
+class CameraGroup(ProcessManager):
+    """Records several cameras that only copy their streams with a single
+    ffmpeg process (one input and one output per camera), which saves the
+    memory of a process per camera. The members keep their own files and
+    are still checked one by one by the StreamManager. A member whose file
+    stops growing kills the shared process, which restarts this group but
+    no other stream.
+    """
+    def __init__(self, members, logLocation='../logs/', logLevel='INFO', initTime=15):
+        self.members = members
+        first = members[0]
+        super(CameraGroup, self).__init__(first.dvrName, '+'.join(m.streamName for m in members), first.storagePath,
+             first.container, first.recordingSchedule, True, logLocation, logLevel, initTime, first.endAtDuration)
+        self.ffmpegLogLevel = first.ffmpegLogLevel
+        self.progress = processoutput.ProgressTracker()
+        self.progress.onUpdate = self.readyEvent.set
+        self.processOutput.progress = self.progress
+        for m in members:
+            m.group = self
+
+    def start_recording(self, path=''):
+        # every member asks for the group to start, only the first one does anything
+        if self.isStarting or self.isRecording:
+            return
+        super(CameraGroup, self).start_recording(path)
+
+    def recording_ended(self):
+        self.isStarting = False
+        for m in self.members:
+            m.isStarting = False
+            if self.supervisor is not None:
+                self.supervisor.wake(m.streamName)
+
+    def record_steps(self):
+        self.consecutiveFailCount = max(m.consecutiveFailCount for m in self.members)
+        try:
+            return (yield from super(CameraGroup, self).record_steps())
+        finally:
+            for m in self.members:
+                m.isRecording = False
+                m.consecutiveFailCount = self.consecutiveFailCount
+
+    def new_file_name(self, dateStr, startTimeStr, endTimeStr):
+        for m in self.members:
+            m.currentFile = m.format_file_name(dateStr, startTimeStr, endTimeStr)
+        return self.members[0].currentFile
+
+    def build_command(self, videoDuration, fileName=None):
+        self.logger.debug("Building ffmpeg command string for {} cameras...".format(len(self.members)))
+        cmd_args = ['ffmpeg', '-progress', 'pipe:1', '-y', '-loglevel', self.ffmpegLogLevel]
+        for m in self.members:
+            cmd_args += m.build_input_args()
+        for i, m in enumerate(self.members):
+            cmd_args += ['-map', str(i)] + m.build_codec_args() + m.build_output_args(videoDuration)
+        return cmd_args
+
+    def initialize_steps(self, duration):
+        for m in self.members:
+            m.process = None
+            m.startTime = time.time()
+            m.isRecording = True
+            m.reset_growth_check()
+        pstat = yield from super(CameraGroup, self).initialize_steps(duration)
+        for m in self.members:
+            m.process = self.process
+            m.cmd_args = self.cmd_args
+            m.stopTime = self.stopTime
+            m.isStarting = False
+        return pstat
+
+    def is_ready(self):
+        return self.progress.updateCount > 0 or all(m.is_ready() for m in self.members)
+
+    def rename_file(self, dateStr, startTimeStr):
+        for m in self.members:
+            if m.currentFile is not None:
+                m.rename_file(dateStr, startTimeStr)
+        self.currentFile = self.lastFile = self.members[0].currentFile
+
+    def reset_growth_check(self):
+        super(CameraGroup, self).reset_growth_check()
+        for m in self.members:
+            m.reset_growth_check()
+
 class CommandRecorder(ProcessManager):
 
     def __init__(self, dvrName, streamName, storagePath, container, commandStr, recordingSchedule,
@@ -735,7 +1515,7 @@ class CommandRecorder(ProcessManager):
              recordingSchedule, createFilename, logLocation, logLevel, 15, True)
 
 
-    def build_command(self, duration=None):
+    def build_command(self, duration=None, fileName=None):
         if self.createFilename:
-            return self.commandStr.format(filename=self.currentFile).split()
+            return self.commandStr.format(filename=self.currentFile if fileName is None else fileName).split()
         return self.commandStr.split()
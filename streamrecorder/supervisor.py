@@ -0,0 +1,154 @@
+'''
+Event-driven scheduling for the stream manager.
+
+Instead of checking every stream on a fixed sleep, the supervisor keeps a heap
+of timers and sleeps until the earliest one is due. It also wakes up as soon
+as a watched child process exits (through a pidfd where the kernel supports
+it, otherwise through SIGCHLD) or another thread asks for a timer to run now.
+'''
+
+import collections
+import heapq
+import itertools
+import os
+import selectors
+import signal
+import threading
+import time
+
+
+class Supervisor(object):
+    """Runs keyed callbacks at their deadlines from a timer heap. A callback
+    returns the time it wants to run again, or None to stop its timer.
+    """
+    def __init__(self, maxWait=60):
+        self.maxWait = maxWait                  # upper limit on a sleep, so clock changes are noticed
+        self.timers = []                        # heap of (deadline, seq, key)
+        self.entries = {}                       # key -> seq of its live heap entry
+        self.callbacks = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()
+        self.newProcesses = collections.deque()
+        self.polledProcesses = []               # (process, callback) for processes without a pidfd
+        self.watchingSigchld = False
+        self.wakeups = 0
+        self.wakeRead, self.wakeWrite = os.pipe()
+        os.set_blocking(self.wakeRead, False)
+        os.set_blocking(self.wakeWrite, False)
+        self.selector.register(self.wakeRead, selectors.EVENT_READ, None)
+
+    def schedule(self, key, deadline, callback=None):
+        """Run callback (or the last callback given for key) at deadline, replacing any earlier timer for key."""
+        with self.lock:
+            if callback is not None:
+                self.callbacks[key] = callback
+            seq = next(self.counter)
+            self.entries[key] = seq
+            heapq.heappush(self.timers, (deadline, seq, key))
+
+    def reschedule(self, key, deadline):
+        # like schedule, but a wake up that came in while the callback was running wins
+        with self.lock:
+            if key in self.entries:
+                return
+            seq = next(self.counter)
+            self.entries[key] = seq
+            heapq.heappush(self.timers, (deadline, seq, key))
+
+    def cancel(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def wake(self, key):
+        """Run the timer for key as soon as possible. Safe to call from any thread."""
+        if key in self.callbacks:
+            self.schedule(key, time.time())
+            self.notify()
+
+    def notify(self):
+        try:
+            os.write(self.wakeWrite, b'\0')
+        except BlockingIOError:
+            pass            # a wake up is already pending
+
+    def watch_process(self, process, callback):
+        """Call callback from the supervisor thread when process exits. Safe to call from any thread."""
+        self.newProcesses.append((process, callback))
+        self.notify()
+
+    def register_new_processes(self):
+        while len(self.newProcesses) > 0:
+            process, callback = self.newProcesses.popleft()
+            try:
+                fd = os.pidfd_open(process.pid)
+            except (AttributeError, OSError):
+                # no pidfd support, check the process whenever a child exits (or at least every maxWait)
+                if not self.watchingSigchld:
+                    self.watchingSigchld = self.watch_sigchld()
+                self.polledProcesses.append((process, callback))
+                continue
+            self.selector.register(fd, selectors.EVENT_READ, callback)
+
+    def watch_sigchld(self):
+        """Wake up on SIGCHLD, for processes that can't be watched with a pidfd. Only works from the main thread."""
+        if threading.current_thread() is not threading.main_thread() or not hasattr(signal, 'SIGCHLD'):
+            return False
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        signal.set_wakeup_fd(self.wakeWrite, warn_on_full_buffer=False)
+        return True
+
+    def get_timeout(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            while len(self.timers) > 0 and self.entries.get(self.timers[0][2]) != self.timers[0][1]:
+                heapq.heappop(self.timers)          # drop entries that were replaced or cancelled
+            if len(self.timers) == 0:
+                return self.maxWait
+            return min(max(self.timers[0][0] - now, 0), self.maxWait)
+
+    def pop_due(self, now):
+        due = []
+        with self.lock:
+            while len(self.timers) > 0 and self.timers[0][0] <= now:
+                deadline, seq, key = heapq.heappop(self.timers)
+                if self.entries.get(key) == seq:
+                    del self.entries[key]
+                    due.append(key)
+        return due
+
+    def run_once(self):
+        """Sleep until something needs attention and handle it. Returns the number of timers run."""
+        events = self.selector.select(self.get_timeout())
+        self.wakeups += 1
+        for key, mask in events:
+            if key.data is None:
+                try:
+                    while os.read(self.wakeRead, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            else:
+                # the pidfd became readable, so the process has exited
+                self.selector.unregister(key.fd)
+                os.close(key.fd)
+                key.data()
+        self.register_new_processes()
+        for process, callback in list(self.polledProcesses):
+            if process.poll() is not None:
+                self.polledProcesses.remove((process, callback))
+                callback()
+
+        due = self.pop_due(time.time())
+        for key in due:
+            deadline = self.callbacks[key]()
+            if deadline is not None:
+                self.reschedule(key, deadline)
+        return len(due)
+
+    def run(self, maxRounds=None):
+        """Handle timers and process exits for maxRounds wake ups (forever by default)."""
+        rounds = 0
+        while maxRounds is None or rounds < maxRounds:
+            self.run_once()
+            rounds += 1
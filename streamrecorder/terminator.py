@@ -0,0 +1,124 @@
+'''
+Stops child processes without blocking the caller on each one.
+
+Every process handed to the Terminator gets SIGTERM straight away. One
+background thread then waits on all of them at once (through pidfds where
+the kernel has them, polling otherwise), forgets each process as soon as it
+exits and sends SIGKILL to any that are still running after the grace
+time. Stopping many processes therefore takes about as long as the slowest
+one, not the sum of them.
+'''
+
+import os
+import selectors
+import threading
+import time
+
+
+class Terminator(object):
+    """Terminates child processes in the background, escalating to SIGKILL per child."""
+    def __init__(self, graceTime=3, killTime=3, pollInterval=0.1):
+        self.graceTime = graceTime          # seconds to wait after SIGTERM before SIGKILL
+        self.killTime = killTime            # seconds to wait after SIGKILL before giving up
+        self.pollInterval = pollInterval
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.stopping = {}                  # process -> [logger, deadline, killed, pidfd]
+        self.selector = selectors.DefaultSelector()
+        self.readyProcesses = set()         # processes whose pidfd was readable in the last round
+        self.thread = None
+
+    def stop(self, process, logger=None):
+        """Send process SIGTERM and return right away. Does nothing if it is already being stopped."""
+        with self.lock:
+            if process in self.stopping:
+                return
+            try:
+                pidfd = os.pidfd_open(process.pid)
+            except (AttributeError, OSError, TypeError):
+                pidfd = None                # no pidfd support, poll it instead
+            self.stopping[process] = [logger, time.monotonic() + self.graceTime, False, pidfd]
+            if pidfd is not None:
+                self.selector.register(pidfd, selectors.EVENT_READ, process)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+            self.changed.notify_all()
+        try:
+            process.terminate()
+        except Exception as e:
+            if logger is not None:
+                logger.error('Process did not respond to SIGTERM: {}'.format(e))
+
+    def is_stopping(self, process):
+        with self.lock:
+            return process in self.stopping
+
+    def wait(self, processes, timeout=None):
+        """Wait until none of processes is being stopped any more. Returns False on timeout."""
+        with self.lock:
+            return self.changed.wait_for(lambda: not any(p in self.stopping for p in processes), timeout)
+
+    def forget(self, process):
+        # called with the lock held
+        logger, deadline, killed, pidfd = self.stopping.pop(process)
+        if pidfd is not None:
+            self.selector.unregister(pidfd)
+            os.close(pidfd)
+        self.changed.notify_all()
+
+    def check(self, process, now):
+        # called with the lock held
+        entry = self.stopping[process]
+        logger, deadline, killed, pidfd = entry
+        if process.poll() is not None:
+            self.forget(process)
+        elif now >= deadline and not killed:
+            if logger is not None:
+                logger.error("Process is still alive! Trying SIGKILL!")
+            try:
+                process.kill()
+            except Exception as e:
+                if logger is not None:
+                    logger.error("Process did not respond to SIGKILL: {}".format(e))
+            entry[1], entry[2] = now + self.killTime, True
+        elif now >= deadline:
+            if logger is not None:
+                logger.critical("Could not kill process! Somthing weird is happening!")
+            self.forget(process)
+        elif pidfd is not None and process in self.readyProcesses:
+            # it has exited but someone else reaps it (the asyncio loop), stop watching the pidfd and poll it
+            self.selector.unregister(pidfd)
+            os.close(pidfd)
+            entry[3] = None
+
+    def run(self):
+        while True:
+            with self.lock:
+                self.changed.wait_for(lambda: len(self.stopping) > 0)
+                timeout = max(min(entry[1] for entry in self.stopping.values()) - time.monotonic(), 0)
+            # processes without a pidfd (and newly added ones) are looked at every pollInterval
+            timeout = min(timeout, self.pollInterval)
+            if len(self.selector.get_map()) > 0:
+                events = self.selector.select(timeout)
+            else:
+                events = []
+                time.sleep(timeout)
+            with self.lock:
+                self.readyProcesses = set(key.data for key, mask in events)
+                now = time.monotonic()
+                for process in list(self.stopping):
+                    self.check(process, now)
+
+
+_terminator = None
+_terminatorLock = threading.Lock()
+
+def get_terminator():
+    """Get the shared terminator, creating it the first time it is needed."""
+    global _terminator
+    with _terminatorLock:
+        if _terminator is None:
+            _terminator = Terminator()
+    return _terminator
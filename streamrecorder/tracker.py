@@ -26,6 +26,8 @@ Stream dictionary:
     lastFileSize: size of the most recent complete file
     currentFile: the name of the file being recorded to
     currentFileSize: the size of the file being recorded to
+    ingest: live metrics from ffmpeg's progress output (frame, fps, bitrate, totalSize, outTime, speed,
+            dupFrames, dropFrames, updates, stalledFor), empty if the stream does not report progress
 '''
 
 import time
@@ -64,6 +66,8 @@ class StreamManagerTracker(object):
                 stats['lastFileSize'] = 'ERROR'
         else:
             stats['lastFileSize'] = 0
+        stats['ingest'] = recorder.get_ingest_metrics()
+        stats['cpu'] = {'cores': recorder.cpuCost, 'level': recorder.cpuLevel}
         return stats
 
     def directory_contains_video(self, path):
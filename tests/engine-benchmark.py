@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+'''
+Compares the memory use and wake ups of the recording engines.
+
+Each run starts a fresh interpreter with the given number of simulated
+streams (command streams running `sleep`), waits for them to warm up and
+then counts the context switches of all of its threads over the measuring
+period. Usage:
+
+    python3 engine-benchmark.py --streams 10 100 500 --duration 60
+'''
+
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def read_status(path, keys):
+    values = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in keys:
+                values[key] = int(value.split()[0])
+    return values
+
+def get_context_switches():
+    total = 0
+    for task in os.listdir('/proc/self/task'):
+        try:
+            status = read_status('/proc/self/task/{}/status'.format(task), ['voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches'])
+        except (IOError, OSError):
+            continue            # the thread exited
+        total += sum(status.values())
+    return total
+
+def run_streams(engine, nStreams, warmup, duration, command):
+    from streamrecorder import schedule
+    from streamrecorder import stream
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))        # each stream needs a few descriptors
+    tempDir = tempfile.mkdtemp()
+    try:
+        logger = logging.getLogger('benchmark')
+        manager = stream.StreamManager('benchmark', __file__, tempDir, logger, os.path.join(tempDir, 'main.log'),
+                                       logLocation=tempDir, engine=engine)
+        for i in range(nStreams):
+            manager.add_command_stream('stream{}'.format(i), 'txt', command, schedule.RecordingSchedule('always'))
+        manager.start_streams()
+        time.sleep(warmup)
+        startSwitches = get_context_switches()
+        time.sleep(duration)
+        switches = get_context_switches() - startSwitches
+        status = read_status('/proc/self/status', ['VmRSS', 'Threads'])
+        running = sum(1 for r in manager.processes.values() if r.process is not None and r.process.poll() is None)
+        for r in manager.processes.values():
+            if r.process is not None and r.process.poll() is None:
+                r.process.kill()
+        return {'engine': engine, 'streams': nStreams, 'running': running, 'rssKiB': status['VmRSS'],
+                'threads': status['Threads'], 'wakeupsPerSecond': switches / float(duration)}
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the memory use and wake ups of the recording engines.')
+    parser.add_argument('--streams', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--engines', nargs='+', default=['threads', 'asyncio'])
+    parser.add_argument('--warmup', type=float, default=20, help='seconds to wait for the streams to start (at least initTime)')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to measure for')
+    parser.add_argument('--command', default='sleep 3600', help='command each simulated stream runs')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_streams(args.engines[0], args.streams[0], args.warmup, args.duration, args.command)
+        print(json.dumps(result))
+        sys.stdout.flush()
+        os._exit(0)         # don't wait for the recording threads
+
+    print('{:>8} {:>8} {:>8} {:>10} {:>8} {:>10}'.format('engine', 'streams', 'running', 'RSS (MiB)', 'threads', 'wakeups/s'))
+    for nStreams in args.streams:
+        for engine in args.engines:
+            output = subprocess.check_output([sys.executable, __file__, '--child', '--engines', engine, '--streams', str(nStreams),
+                                              '--warmup', str(args.warmup), '--duration', str(args.duration), '--command', args.command])
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            print('{engine:>8} {streams:>8} {running:>8} {rss:>10.1f} {threads:>8} {wakeupsPerSecond:>10.1f}'.format(
+                rss=result['rssKiB']/1024.0, **result))
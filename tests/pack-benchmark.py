@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+'''
+Measures the memory used per camera when recording copy-codec streams with
+one ffmpeg process per camera and when packing several cameras into each
+process (the PackCameras option).
+
+The cameras are simulated by a short H.264 clip that every input plays in
+a loop at its real rate, and the outputs are copied to files just like the
+recorders do. Usage:
+
+    python3 pack-benchmark.py --cameras 8 --pack 1 2 4 8 --duration 30
+'''
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+def read_rss(pid):
+    # resident memory of a process in KiB
+    with open('/proc/{}/status'.format(pid)) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+def make_sample(path, seconds, size, rate):
+    subprocess.check_call(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i',
+                           'testsrc=size={}:rate={}'.format(size, rate), '-t', str(seconds),
+                           '-c:v', 'libx264', '-g', str(rate), '-pix_fmt', 'yuv420p', path])
+
+def build_command(sample, outputs, duration):
+    # the same layout as CameraGroup.build_command: all the inputs, then one mapped output per input
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error']
+    for _ in outputs:
+        cmd += ['-re', '-stream_loop', '-1', '-i', sample]
+    for i, output in enumerate(outputs):
+        cmd += ['-map', str(i), '-c', 'copy', '-t', str(duration), output]
+    return cmd
+
+def run(sample, tempDir, nCameras, packSize, warmup, duration):
+    outputs = [os.path.join(tempDir, 'camera{}_{}.avi'.format(i, packSize)) for i in range(nCameras)]
+    processes = [subprocess.Popen(build_command(sample, outputs[i:i+packSize], warmup + duration + 10))
+                 for i in range(0, nCameras, packSize)]
+    try:
+        time.sleep(warmup)
+        samples = []
+        end = time.time() + duration
+        while time.time() < end:
+            samples.append(sum(read_rss(p.pid) for p in processes if p.poll() is None))
+            time.sleep(1)
+        running = sum(1 for p in processes if p.poll() is None)
+    finally:
+        for p in processes:
+            p.kill()
+            p.wait()
+        for output in outputs:
+            if os.path.exists(output):
+                os.remove(output)
+    rss = max(samples) if len(samples) > 0 else 0
+    return {'packSize': packSize, 'processes': len(processes), 'running': running,
+            'rssKiB': rss, 'rssPerCameraKiB': rss / float(nCameras)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the memory used per camera with and without packing cameras into one ffmpeg process.')
+    parser.add_argument('--cameras', type=int, default=8, help='number of simulated cameras')
+    parser.add_argument('--pack', type=int, nargs='+', default=[1, 2, 4, 8], help='cameras per ffmpeg process to try')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds to wait for the processes to start')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to measure for')
+    parser.add_argument('--size', default='1280x720', help='frame size of the simulated cameras')
+    parser.add_argument('--rate', type=int, default=15, help='frame rate of the simulated cameras')
+    args = parser.parse_args()
+
+    if shutil.which('ffmpeg') is None:
+        print('ffmpeg is needed to run this benchmark')
+        sys.exit(1)
+    tempDir = tempfile.mkdtemp()
+    try:
+        sample = os.path.join(tempDir, 'sample.mp4')
+        make_sample(sample, 10, args.size, args.rate)
+        print('{:>6} {:>10} {:>8} {:>10} {:>16}'.format('pack', 'processes', 'running', 'RSS (MiB)', 'per camera (MiB)'))
+        for packSize in args.pack:
+            result = run(sample, tempDir, args.cameras, packSize, args.warmup, args.duration)
+            print('{packSize:>6} {processes:>10} {running:>8} {rss:>10.1f} {perCamera:>16.1f}'.format(
+                rss=result['rssKiB']/1024.0, perCamera=result['rssPerCameraKiB']/1024.0, **result))
+    finally:
+        shutil.rmtree(tempDir, ignore_errors=True)
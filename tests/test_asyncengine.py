@@ -0,0 +1,93 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from unittest import mock
+
+sys.path.append('..')
+from streamrecorder import asyncengine
+from streamrecorder import stream
+
+def make_recorder(commandStr, tmp_path):
+    schedMock = mock.Mock()
+    schedMock.check_recording_schedule.return_value = True
+    schedMock.get_recording_duration.return_value = 60
+    with mock.patch('streamrecorder.dvrutils.setup_logging') as logMock:
+        logMock.return_value = mock.Mock()
+        recorder = stream.CommandRecorder('dvrName', 'command', str(tmp_path), 'txt', commandStr, schedMock, str(tmp_path))
+    recorder.initTime = 0
+    recorder.checkInterval = 0.05
+    return recorder
+
+@mock.patch('subprocess.call')
+def test_run_recording(callMock, tmp_path):
+    engine = asyncengine.AsyncEngine()
+    recorders = [make_recorder('echo hello', tmp_path), make_recorder('false', tmp_path)]
+    recorders += [make_recorder('sleep 0.2', tmp_path) for _ in range(20)]
+    recorders[0].supervisor = mock.Mock()
+    threadCount = threading.active_count()
+    futures = [engine.start_recording(r) for r in recorders]
+    time.sleep(0.1)
+    assert threading.active_count() < threadCount + 10        # the loop thread and a few pool threads, not one per stream
+    for future in futures:
+        assert future.result(timeout=10) == False
+    assert recorders[0].consecutiveFailCount == 0
+    assert recorders[1].consecutiveFailCount == 1
+    assert recorders[0].isRecording == False
+    assert recorders[0].process.poll() == 0
+    recorders[0].supervisor.wake.assert_called_once_with('command')
+    callMock.assert_called_with(['sync'])
+    for _ in range(100):
+        if len(recorders[0].processOutput.get_recent_lines()) > 0:
+            break
+        time.sleep(0.05)
+    assert recorders[0].processOutput.get_recent_lines()[-1].endswith('hello\n')
+    engine.start()                      # already running
+    assert engine.thread.is_alive()
+
+def test_stop_long_recording(tmp_path):
+    engine = asyncengine.AsyncEngine()
+    recorder = make_recorder('sleep 30', tmp_path)
+    recorder.recordingSchedule.get_recording_duration.return_value = 0.2
+    start = time.monotonic()
+    with mock.patch('streamrecorder.dvrutils.kill_process') as killMock:
+        killMock.side_effect = lambda process, logger: process.kill()
+        engine.start_recording(recorder).result(timeout=10)
+    assert time.monotonic() - start < 10
+    assert recorder.process.poll() == -signal.SIGKILL
+
+def test_async_process():
+    processMock = mock.Mock()
+    processMock.pid = 123
+    processMock.returncode = None
+    process = asyncengine.AsyncProcess(processMock)
+    assert process.poll() == None
+    assert process.stdout == None
+    with mock.patch('os.kill') as killMock:
+        process.terminate()
+        killMock.assert_called_once_with(123, signal.SIGTERM)
+        killMock.side_effect = ProcessLookupError()
+        process.kill()
+        processMock.returncode = 0
+        process.kill()
+        assert killMock.call_count == 2
+    assert process.poll() == 0
+
+def test_ready_step(tmp_path):
+    engine = asyncengine.AsyncEngine()
+    recorder = make_recorder('sleep 5', tmp_path)
+    recorder.currentFile = str(tmp_path / 'file.txt')
+    recorder.readyCheckInterval = 0.01
+    engine.start()
+    async def wait_ready(timeout):
+        recorder.process = await engine.do_step(recorder, ('spawn', ['sh', '-c', 'sleep 0.1; echo data > ' + recorder.currentFile + '; sleep 5']))
+        return await engine.do_step(recorder, ('ready', timeout))
+    assert asyncio.run_coroutine_threadsafe(wait_ready(5), engine.loop).result(timeout=10) == True
+    recorder.process.kill()
+    os.remove(recorder.currentFile)
+    assert asyncio.run_coroutine_threadsafe(wait_ready(0.05), engine.loop).result(timeout=10) == False
+    recorder.process.kill()
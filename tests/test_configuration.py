@@ -417,6 +417,36 @@ def test_get_stream_options(schedMock, deepCopyMock):
     assert args3['container'] == 'avi'
     assert args3['framerate'] == '10'
     assert args3['filedurationminutes'] == '3'
+    assert 'segmentfiles' not in args3
+
+    handler.streamParams['default']['segmentfiles'] = 'True'
+    args4 = handler.get_stream_options('', '(segmentFiles=False)')
+    assert args4['segmentfiles'] == 'False'
+    args5 = handler.get_stream_options()
+    assert args5['segmentfiles'] == 'True'
+
+def test_get_recorder_options():
+    handler = create_handler()
+    assert handler.get_recorder_options({'codec':'copy'}) == {}
+    assert handler.get_recorder_options({'segmentfiles':'True'}) == {'segmentFiles':True}
+    assert handler.get_recorder_options({'segmentfiles':'no'}) == {'segmentFiles':False}
+    assert handler.get_recorder_options({'overlapseconds':'10'}) == {'overlapSeconds':10}
+    assert handler.get_recorder_options({'proxycontainer':'mp4', 'proxywidth':'480', 'snapshotseconds':'30'}) == {
+        'proxyContainer':'mp4', 'proxyWidth':480, 'snapshotSeconds':30}
+    assert handler.get_recorder_options({'proxycontainer':'None'}) == {'proxyContainer':None}
+    assert handler.get_recorder_options({'priority':'3'}) == {'priority':3}
+    with pytest.raises(Exception):
+        handler.get_recorder_options({'overlapseconds':'ten'})
+
+def test_get_manager_options():
+    handler = create_handler()
+    assert handler.get_manager_options() == {}
+    handler.genParams['engine'] = ' AsyncIO'
+    assert handler.get_manager_options() == {'engine':'asyncio'}
+    handler.genParams['packcameras'] = '4'
+    assert handler.get_manager_options() == {'engine':'asyncio', 'packCameras':4}
+    handler.genParams['cpubudget'] = '0.8'
+    assert handler.get_manager_options()['cpuBudget'] == 0.8
 
 def test_determine_stream_type():
     handler = create_handler()
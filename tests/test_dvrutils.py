@@ -19,6 +19,30 @@ def test_grabframe(callMock):
                                       '-rtsp_transport','tcp','-i','url',
                                       '-vframes','1','-q','1','imageName'])
 
+@mock.patch('subprocess.call')
+def test_grabframe_from_snapshot(callMock, tmp_path):
+    snapshot = str(tmp_path / 'snapshot.jpg')
+    image = str(tmp_path / 'image.jpg')
+    dvrutils.grabframe('url', image, snapshotFile=snapshot)
+    callMock.assert_called_once()               # no snapshot yet
+    with open(snapshot, 'w') as f:
+        f.write('jpeg')
+    assert dvrutils.grabframe('url', image, snapshotFile=snapshot) == 0
+    callMock.assert_called_once()
+    with open(image) as f:
+        assert f.read() == 'jpeg'
+    os.utime(snapshot, (time.time() - 120, time.time() - 120))
+    dvrutils.grabframe('url', image, snapshotFile=snapshot)
+    assert callMock.call_count == 2             # too old
+
+def test_get_process_cpu_time():
+    cpuTime = dvrutils.get_process_cpu_time(os.getpid())
+    assert cpuTime > 0
+    assert abs(cpuTime - sum(os.times()[:2])) < 1
+    process = subprocess.Popen(['true'])
+    process.wait()
+    assert dvrutils.get_process_cpu_time(process.pid) == None
+
 def test_format_time():
     assert dvrutils.format_time(7317.5) == '02:01:57'
     assert dvrutils.format_time(7317.5, False) == '02:01'
@@ -0,0 +1,134 @@
+import os
+import pytest
+import subprocess
+import sys
+import time
+from unittest import mock
+
+sys.path.append('..')
+
+from streamrecorder import processoutput
+
+def test_feed(tmp_path):
+    output = processoutput.ProcessOutput(str(tmp_path / 'process.log'), maxLines=3)
+    output.feed(b'first line\nsecond')
+    assert output.lineCount == 1
+    assert output.partial == 'second'
+    output.feed(' line\r\nframe=1\rframe=2\n')
+    assert output.lineCount == 4
+    recent = output.get_recent_lines()
+    assert len(recent) == 3
+    assert recent[0].endswith(' -- second line\n')
+    assert recent[-1].endswith(' -- frame=2\n')
+    assert output.get_recent_lines(1) == recent[-1:]
+
+def test_long_lines_are_bounded(tmp_path):
+    output = processoutput.ProcessOutput(str(tmp_path / 'process.log'), maxLineLength=10)
+    output.feed('x' * 25)
+    assert output.partial == ''
+    assert output.lineCount == 1
+    assert len(output.pending) == 1
+
+def test_failed_flush_drops_lines(tmp_path):
+    output = processoutput.ProcessOutput(str(tmp_path / 'missing' / 'process.log'), maxLines=5)
+    for i in range(100):
+        output.add_line('line {}'.format(i))
+    assert output.flush() == 0
+    assert output.pending == []
+    assert len(output.get_recent_lines()) == 5
+
+def test_flush(tmp_path):
+    logName = str(tmp_path / 'process.log')
+    output = processoutput.ProcessOutput(logName, batchLines=2, flushInterval=60)
+    assert output.flush() == 0
+    assert not os.path.exists(logName)
+    output.feed('a\n')
+    assert output.needs_flush() == False
+    assert output.needs_flush(time.monotonic() + 61) == True
+    output.feed('b\n')
+    assert output.needs_flush() == True
+    assert output.flush() == 2
+    assert output.pending == []
+    with open(logName) as f:
+        assert [l.split(' -- ')[1] for l in f.readlines()] == ['a\n', 'b\n']
+    assert len(output.get_recent_lines()) == 2
+
+def test_close(tmp_path):
+    logName = str(tmp_path / 'process.log')
+    output = processoutput.ProcessOutput(logName)
+    output.feed('no newline')
+    output.close()
+    with open(logName) as f:
+        assert f.read().endswith(' -- no newline\n')
+
+def test_progress_lines_are_parsed(tmp_path):
+    output = processoutput.ProcessOutput(str(tmp_path / 'process.log'))
+    output.progress = processoutput.ProgressTracker()
+    output.feed('frame=150\nfps=15.00\nstream_0_0_q=-1.0\nbitrate=1024.5kbits/s\ntotal_size=1280000\n'
+                'out_time_us=10000000\nout_time_ms=10000000\nout_time=00:00:10.000000\ndup_frames=1\n'
+                'drop_frames=2\nspeed=1.01x\nprogress=continue\n')
+    output.feed('[rtsp @ 0x1] frame=bad things happened\n')
+    assert output.lineCount == 1
+    assert output.get_recent_lines()[0].endswith('frame=bad things happened\n')
+    metrics = output.progress.get_metrics()
+    assert metrics['frame'] == 150
+    assert metrics['fps'] == 15.0
+    assert metrics['bitrate'] == 1024.5
+    assert metrics['totalSize'] == 1280000
+    assert metrics['outTime'] == 10.0
+    assert metrics['dupFrames'] == 1
+    assert metrics['dropFrames'] == 2
+    assert metrics['speed'] == 1.01
+    assert metrics['updates'] == 1
+    assert metrics['stalledFor'] >= 0
+
+def test_progress_stall_time():
+    progress = processoutput.ProgressTracker()
+    assert progress.get_stall_time() == None
+    progress.parse_line('bitrate=N/A')
+    progress.parse_line('out_time_us=N/A')
+    progress.parse_line('progress=continue')
+    assert progress.get_metrics()['bitrate'] == None
+    start = progress.lastAdvance
+    assert progress.get_stall_time(start + 3) == 3
+    for outTime in ['1000000', '1000000']:
+        progress.parse_line('out_time_us=' + outTime)
+        progress.parse_line('progress=continue')
+    firstAdvance = progress.lastAdvance
+    assert firstAdvance >= start
+    progress.parse_line('out_time_us=1000000')
+    progress.parse_line('progress=continue')
+    assert progress.lastAdvance == firstAdvance         # media time did not move
+    progress.parse_line('out_time_us=2000000')
+    progress.parse_line('progress=end')
+    assert progress.ended == True
+    assert progress.updateCount == 5
+    progress.reset()
+    assert progress.updateCount == 0
+    assert progress.get_stall_time() == None
+
+def test_monitor(tmp_path):
+    logName = str(tmp_path / 'process.log')
+    monitor = processoutput.OutputMonitor(checkInterval=0.05)
+    monitor.start()
+    output = processoutput.ProcessOutput(logName, maxLines=50, flushInterval=0)
+    process = subprocess.Popen([sys.executable, '-c', 'for i in range(1000): print("line", i)'],
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0, universal_newlines=True)
+    output.watch(process, monitor)
+    process.wait()
+    deadline = time.time() + 5
+    while (output.lineCount < 1000 or len(monitor.outputs) > 0) and time.time() < deadline:
+        time.sleep(0.01)
+    assert output.lineCount == 1000
+    assert len(output.get_recent_lines()) == 50
+    assert output.get_recent_lines(1)[0].endswith('line 999\n')
+    with open(logName) as f:
+        assert len(f.readlines()) == 1000
+
+def test_watch_without_pipe():
+    monitorMock = mock.Mock()
+    output = processoutput.ProcessOutput('process.log')
+    processMock = mock.Mock()
+    processMock.stdout = None
+    output.watch(processMock, monitorMock)
+    monitorMock.add.assert_not_called()
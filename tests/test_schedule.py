@@ -232,7 +232,31 @@ def test_get_recording_duration():
     assert my_schedule.get_recording_duration(midnight) == 3600
     my_schedule = schedule.RecordingSchedule('0000-0012', 60)
     assert my_schedule.get_recording_duration(midnight) == 720
-    
+
+def test_get_active_duration():
+    midnight = (datetime.datetime(2018, 1, 1, 0, 0, 0) - datetime.datetime(1970,1,1)).total_seconds()
+    midnight += time.mktime(time.gmtime()) - time.mktime(time.localtime())
+    my_schedule = schedule.RecordingSchedule('0000-0100', 5)
+    assert my_schedule.get_active_duration(midnight) == 3600
+    assert my_schedule.get_active_duration(midnight + 330) == 3270
+    assert my_schedule.get_active_duration(midnight + 3600) == 0
+    my_schedule = schedule.RecordingSchedule('0000-0100;0100-0200', 5)
+    assert my_schedule.get_active_duration(midnight + 3000) == 4200
+
+def test_get_next_transition():
+    midnight = (datetime.datetime(2018, 1, 1, 0, 0, 0) - datetime.datetime(1970,1,1)).total_seconds()     # a Monday
+    midnight += time.mktime(time.gmtime()) - time.mktime(time.localtime())
+    assert schedule.RecordingSchedule().get_next_transition(midnight) == None
+    my_schedule = schedule.RecordingSchedule('0100-0200;0130-0300', 5)
+    assert my_schedule.get_next_transition(midnight) == midnight + 3600
+    assert my_schedule.get_next_transition(midnight + 3600) == midnight + 10800
+    assert my_schedule.get_next_transition(midnight + 10800) == midnight + 86400 + 3600
+    my_schedule = schedule.RecordingSchedule('Wed:0900-1000', 5)
+    assert my_schedule.get_next_transition(midnight + 60) == midnight + 2*86400 + 32400
+    assert my_schedule.get_next_transition(midnight + 2*86400 + 36000) == midnight + 9*86400 + 32400
+    my_schedule = schedule.RecordingSchedule('always', 5)
+    assert my_schedule.get_next_transition(midnight + 600) == midnight + 86400
+
 def test_get_interval_endtime():
     midnight = (datetime.datetime(2018, 1, 1, 0, 0, 0) - datetime.datetime(1970,1,1)).total_seconds()
     midnight += time.mktime(time.gmtime()) - time.mktime(time.localtime())
@@ -26,6 +26,12 @@ def test_cotr():
     assert infoSender.reportFail == False
     
 
+def test_get_next_send():
+    infoSender = sender.InformationSender('dummy', 'user', 'passwd', '240.0.0.0',
+                                          5, 'dummy2')
+    infoSender.lastSend = 1000
+    assert infoSender.get_next_send() == 1300
+
 def test_send_info():
     smTrackerMock = mock.Mock()
     smTrackerMock.get_stats.return_value = {'time' : '20180813'}
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from unittest import mock
+
+sys.path.append('..')
+from streamrecorder import supervisor
+
+def test_timers_run_in_order():
+    sup = supervisor.Supervisor()
+    calls = []
+    now = time.time()
+    sup.schedule('b', now + 0.05, lambda: calls.append('b'))
+    sup.schedule('a', now, lambda: calls.append('a') or now + 0.1)
+    assert sup.run_once() == 1
+    assert calls == ['a']
+    assert sup.run_once() == 1
+    assert calls == ['a', 'b']
+    assert sup.run_once() == 1              # a rescheduled itself
+    assert calls == ['a', 'b', 'a']
+    assert time.time() >= now + 0.1
+    assert sup.wakeups == 3
+
+def test_schedule_replaces_timer():
+    sup = supervisor.Supervisor(maxWait=0.05)
+    calls = []
+    now = time.time()
+    sup.schedule('a', now + 60, lambda: calls.append('a'))
+    sup.schedule('a', now)
+    assert sup.run_once() == 1
+    assert sup.run_once() == 0                  # the old entry is gone
+    assert calls == ['a']
+    sup.schedule('b', now, lambda: calls.append('b'))
+    sup.cancel('b')
+    assert sup.get_timeout() == 0.05
+    assert sup.run_once() == 0
+    assert calls == ['a']
+
+def test_wake_from_thread():
+    sup = supervisor.Supervisor()
+    calls = []
+    sup.schedule('a', time.time() + 60, lambda: calls.append('a') or time.time() + 60)
+    sup.wake('not a timer')
+    timer = threading.Timer(0.05, sup.wake, ['a'])
+    timer.start()
+    start = time.monotonic()
+    while sup.run_once() == 0:
+        pass
+    assert time.monotonic() - start < 5
+    assert calls == ['a']
+
+def test_wake_during_callback_wins():
+    sup = supervisor.Supervisor()
+    calls = []
+    def callback():
+        calls.append('a')
+        if len(calls) == 1:
+            sup.wake('a')
+        return time.time() + 60
+    sup.schedule('a', time.time(), callback)
+    sup.run_once()
+    sup.run_once()
+    assert calls == ['a', 'a']
+
+def test_watch_process():
+    sup = supervisor.Supervisor()
+    ended = threading.Event()
+    process = subprocess.Popen(['sleep', '0.1'])
+    sup.watch_process(process, ended.set)
+    start = time.monotonic()
+    while not ended.is_set() and time.monotonic() - start < 5:
+        sup.run_once()
+    assert ended.is_set()
+    assert sup.wakeups < 5              # woken by the exit, not by polling
+    assert len(sup.selector.get_map()) == 1
+    process.wait()
+
+@mock.patch.object(supervisor.Supervisor, 'watch_sigchld')
+@mock.patch('os.pidfd_open')
+def test_watch_process_without_pidfd(pidfdMock, sigchldMock):
+    pidfdMock.side_effect = OSError('not supported')
+    sigchldMock.return_value = False
+    sup = supervisor.Supervisor(maxWait=0.05)
+    ended = threading.Event()
+    process = subprocess.Popen(['sleep', '0.1'])
+    sup.watch_process(process, ended.set)
+    start = time.monotonic()
+    while not ended.is_set() and time.monotonic() - start < 5:
+        sup.run_once()
+    assert ended.is_set()
+    assert sup.polledProcesses == []
+    sigchldMock.assert_called_once_with()
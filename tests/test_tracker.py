@@ -23,6 +23,9 @@ def recorder_mock(num):
     recorderMock.createFilename = True
     recorderMock.isRecording = False
     recorderMock.lastFile = None
+    recorderMock.get_ingest_metrics.return_value = {}
+    recorderMock.cpuCost = None
+    recorderMock.cpuLevel = 0
     return recorderMock
 
 @pytest.fixture
@@ -56,6 +59,8 @@ def test_get_stream_info(create_tracker):
     assert info['currentFileSize'] == 0
     assert info['lastFile'] == None
     assert info['lastFileSize'] == 0
+    assert info['ingest'] == {}
+    assert info['cpu'] == {'cores': None, 'level': 0}
     with open('storage/unitTestStream0/old.txt', 'w') as f:
         f.write('Words')
     with open('storage/unitTestStream0/dvrName_unitTestStream0-20180101_000000-010000.txt', 'w') as f: